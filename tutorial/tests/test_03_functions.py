@@ -1,5 +1,6 @@
 import inspect
 import pathlib
+import random
 from collections import Counter
 from string import ascii_lowercase, ascii_uppercase
 from typing import Any
@@ -334,9 +335,25 @@ def test_longest_sequence(input_nums: list[int], function_to_test) -> None:
         [int(x) for x in read_data("longest_10000.txt").read_text().splitlines()],
     ],
 )
-def test_longest_sequence_best(input_nums: list[int], function_to_test) -> None:
+def test_longest_sequence_best(
+    input_nums: list[int], function_to_test, check_complexity
+) -> None:
     assert function_to_test(input_nums) == reference_longest_sequence(input_nums)
 
+    # `-k test_longest_sequence` selects this test too: only time the best solution
+    if function_to_test.__name__ != "solution_longest_sequence_best":
+        return
+
+    def long_runs(n: int) -> list[int]:
+        """A few long runs of consecutive integers, in random order"""
+        rng = random.Random(n)
+        gaps = set(rng.sample(range(n), 3))
+        nums = [x for x in range(n) if x not in gaps]
+        rng.shuffle(nums)
+        return nums
+
+    check_complexity(function_to_test, long_runs, max_exponent=1.5)
+
 
 #
 # Exercise: Password Validator
@@ -0,0 +1,49 @@
+"""Command-line tools of the test suite, e.g., `python -m tutorial.tests.testsuite grade`"""
+
+import argparse
+import sys
+
+from . import benchmark, grader, llm_backends, telemetry
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m tutorial.tests.testsuite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    telemetry.add_arguments(
+        commands.add_parser(
+            "telemetry", help="summarize the telemetry records of test runs"
+        )
+    )
+
+    grader.add_arguments(
+        commands.add_parser("grade", help="grade a directory of submitted notebooks")
+    )
+
+    benchmark.add_arguments(
+        commands.add_parser("benchmark", help="test and time the reference solutions")
+    )
+
+    llm_backends.add_arguments(
+        commands.add_parser(
+            "fake-llm", help="serve fake AI explanations with the OpenAI API"
+        )
+    )
+
+    args = parser.parse_args(argv)
+
+    match args.command:
+        case "telemetry":
+            return telemetry.main(args)
+        case "grade":
+            return grader.main(args)
+        case "benchmark":
+            return benchmark.main(args)
+        case "fake-llm":
+            return llm_backends.main(args)
+
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,15 @@
 import logging
+import math
+import threading
+import time
 import traceback
 import typing as t
 from enum import Enum
-from threading import Timer
 
 import ipywidgets as widgets
 import markdown2 as md
 import openai
-from IPython.display import Code, display, display_html
+from IPython.display import Code
 from openai.types.chat import (
     ChatCompletionMessage,
     ChatCompletionMessageParam,
@@ -23,12 +25,14 @@ from tenacity import (
 )
 
 from .exceptions import (
-    APIConnectionError,
-    InvalidAPIKeyError,
     InvalidModelError,
     UnexpectedAPIError,
     ValidationResult,
+    ValidationTimeoutError,
 )
+from .llm_backends import ChatBackend, OpenAIBackend
+from .ratelimit import countdowns, estimate_tokens, get_rate_limiter
+from .styles import stylesheets
 
 if t.TYPE_CHECKING:
     from .helpers import IPytestResult
@@ -63,19 +67,15 @@ class Explanation(BaseModel):
 class OpenAIWrapper:
     """A simple API wrapper adapted for IPython environments"""
 
-    # These are the models we can use: they must support structured responses
-    GPT_MODELS = (
-        "gpt-4o",
-        "gpt-4o-mini",
-        "gpt-4.1",
-        "gpt-4.1-mini",
-        "gpt-4.1-nano",
-        "o4-mini",
-    )
+    # These are the models we can use with OpenAI: they must support structured responses
+    GPT_MODELS = OpenAIBackend.GPT_MODELS
 
-    DEFAULT_MODEL = "gpt-4o-mini"
+    DEFAULT_MODEL = OpenAIBackend.default_model
     DEFAULT_LANGUAGE = "English"
 
+    # Seconds a request waits for a background validation
+    VALIDATION_TIMEOUT = 30.0
+
     _instance = None
 
     def __new__(cls, *args, **kwargs) -> "OpenAIWrapper":
@@ -84,67 +84,96 @@ class OpenAIWrapper:
         return cls._instance
 
     @classmethod
-    def create_validated(
+    def create(
         cls,
-        api_key: str,
+        api_key: str | None,
         model: str | None = None,
         language: str | None = None,
-    ) -> tuple["OpenAIWrapper", ValidationResult]:
+        backend: ChatBackend | None = None,
+    ) -> "OpenAIWrapper":
+        """Configure the wrapper without validating anything"""
         instance = cls.__new__(cls)
 
         # Only initialize if not already
-        if not hasattr(instance, "client"):
+        if not hasattr(instance, "backend"):
             instance.api_key = api_key
+            instance.backend = backend or OpenAIBackend(api_key)
             instance.language = language or cls.DEFAULT_LANGUAGE
-            instance.model = model or cls.DEFAULT_MODEL
-            instance.client = openai.OpenAI(api_key=api_key)
+            instance.model = model or instance.backend.default_model
+            instance._validated = threading.Event()
+            instance._validated.set()
+            instance._validation = ValidationResult(is_valid=True)
+
+        return instance
+
+    @classmethod
+    def create_validated(
+        cls,
+        api_key: str | None,
+        model: str | None = None,
+        language: str | None = None,
+        backend: ChatBackend | None = None,
+    ) -> tuple["OpenAIWrapper", ValidationResult]:
+        instance = cls.create(api_key, model, language, backend)
 
         # Validate the model
         model_validation = instance.validate_model(instance.model)
         return instance, model_validation
 
-    @classmethod
-    def validate_api_key(cls, api_key: str | None) -> ValidationResult:
-        """Validate the OpenAI API key"""
-        if not api_key:
-            return ValidationResult(
-                is_valid=False,
-                error=InvalidAPIKeyError("API key is missing."),
-                message="OpenAI API key is not provided.",
-            )
+    def validate_in_background(
+        self, on_done: t.Callable[[ValidationResult], None] | None = None
+    ) -> None:
+        """
+        Validate the backend and the model in a thread, without blocking the kernel.
+        The requests sent in the meantime wait for the validation, and fail if it does.
+        """
+        self._validated.clear()
 
-        try:
-            client = openai.OpenAI(api_key=api_key)
-            client.models.list()  # the simplest API call to verify the API
-        except openai.AuthenticationError:
-            return ValidationResult(
-                is_valid=False,
-                error=InvalidAPIKeyError("The provided API key is invalid."),
-                message="Invalid OpenAI API key. Please, double check it.",
-            )
-        except openai.APIConnectionError:
-            return ValidationResult(
-                is_valid=False,
-                error=APIConnectionError("Unable to connect to OpenAI."),
-                message="Could not connect to OpenAI. Please, check your internet connection.",
-            )
-        except Exception as e:
-            return ValidationResult(
-                is_valid=False,
-                error=UnexpectedAPIError(f"Unexpected error: {e}"),
-                message="An unexpected error occurred while validating API key.",
-            )
-        else:
-            return ValidationResult(is_valid=True)
+        def validate() -> None:
+            try:
+                validation = self.backend.validate()
+                if validation.is_valid:
+                    # Servers that list their models may only know them now
+                    self.model = self.model or self.backend.default_model
+                    validation = self.validate_model(self.model)
+            except Exception as e:
+                validation = ValidationResult(
+                    is_valid=False,
+                    error=UnexpectedAPIError(f"Unexpected error: {e}"),
+                    message="An unexpected error occurred during the validation.",
+                )
+            self._validation = validation
+            self._validated.set()
+            if on_done is not None:
+                on_done(validation)
+
+        threading.Thread(target=validate, name="ai-validation", daemon=True).start()
+
+    def _check_validation(self) -> None:
+        """Wait for a background validation, and raise its error if it failed"""
+        self._validated.wait(self.VALIDATION_TIMEOUT)
+        if not self._validated.is_set():
+            raise ValidationTimeoutError(self.VALIDATION_TIMEOUT)
+        if not self._validation.is_valid:
+            assert self._validation.error is not None  # type checking
+            raise self._validation.error
+
+    @classmethod
+    def validate_api_key(
+        cls, api_key: str | None, backend: ChatBackend | None = None
+    ) -> ValidationResult:
+        """Validate the API key, or that the backend can be reached"""
+        return (backend or OpenAIBackend(api_key)).validate()
 
     def validate_model(self, model: str | None) -> ValidationResult:
         """Validate the model selection"""
         try:
-            if model not in self.GPT_MODELS:
+            models = self.backend.models()
+            if not model or (models is not None and model not in models):
                 return ValidationResult(
                     is_valid=False,
                     error=InvalidModelError(),
-                    message=f"Invalid model: {model}. Available models: {' '.join(self.GPT_MODELS)}",
+                    message=f"Invalid model: {model}. Available models: {' '.join(models or ())}",
                 )
         except Exception as e:
             return ValidationResult(
@@ -160,23 +189,29 @@ class OpenAIWrapper:
         api_key: str | None,
         model: str | None = None,
         language: str | None = None,
+        backend: ChatBackend | None = None,
     ) -> None:
-        """Initialize the wrapper for OpenAI API with logging and checks"""
-        # Avoid reinitializing the client
-        if hasattr(self, "client"):
+        """Initialize the wrapper for a chat backend, OpenAI by default, with logging and checks"""
+        # Avoid reinitializing the backend
+        if hasattr(self, "backend"):
             return
 
+        backend = backend or OpenAIBackend(api_key)
+
         # Validate the API key
-        validation = self.validate_api_key(api_key)
+        validation = backend.validate()
         if not validation.is_valid:
             assert validation.error is not None  # for type checking
             raise validation.error
 
         self.api_key = api_key
         self.language = language or self.DEFAULT_LANGUAGE
-        self.client = openai.OpenAI(api_key=self.api_key)
+        self.backend = backend
+        self._validated = threading.Event()
+        self._validated.set()
+        self._validation = validation
 
-        self.model = model or self.DEFAULT_MODEL
+        self.model = model or backend.default_model
         model_validation = self.validate_model(self.model)
         if not model_validation.is_valid:
             assert model_validation.error is not None  # type checking
@@ -193,15 +228,8 @@ class OpenAIWrapper:
         self.model = model
         logger.info("Model changed to %s", self.model)
 
-    @retry(
-        retry=retry_if_exception_type(openai.RateLimitError),
-        stop=stop_after_attempt(3),
-        wait=wait_fixed(10) + wait_random(0, 5),
-    )
-    def get_chat_response(
-        self, query: str, *args, **kwargs
-    ) -> ParsedChatCompletionMessage | ChatCompletionMessage:
-        """Fetch a completion from the chat model"""
+    def _messages(self, query: str) -> list[ChatCompletionMessageParam]:
+        """The system prompt and the query"""
         system_prompt = (
             "As an expert Python developer, provide clear and concise explanations of error tracebacks, "
             "focusing on the root cause for users with minimal Python experience. "
@@ -213,17 +241,57 @@ class OpenAIWrapper:
             "- Any text or string must be written in Markdown."
         )
 
-        messages: list[ChatCompletionMessageParam] = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": query},
         ]
 
+    @retry(
+        retry=retry_if_exception_type(openai.RateLimitError),
+        stop=stop_after_attempt(3),
+        wait=wait_fixed(10) + wait_random(0, 5),
+    )
+    def get_chat_response(
+        self, query: str, *args, **kwargs
+    ) -> ParsedChatCompletionMessage | ChatCompletionMessage:
+        """Fetch a completion from the chat model"""
+        self._check_validation()
+        messages = self._messages(query)
+        estimated = self._acquire(messages)
+        try:
+            result = self.backend.parse(self.model, messages, Explanation, **kwargs)
+        except openai.APIError:
+            logger.exception("API error encountered.")
+            raise
+        except openai.LengthFinishReasonError:
+            logger.exception("Input prompt has too many tokens.")
+            raise
+        else:
+            get_rate_limiter().record_usage(estimated, result.total_tokens)
+            return result.message
+
+    @retry(
+        retry=retry_if_exception_type(openai.RateLimitError),
+        stop=stop_after_attempt(3),
+        wait=wait_fixed(10) + wait_random(0, 5),
+    )
+    def stream_chat_response(
+        self,
+        query: str,
+        on_partial: t.Callable[[dict[str, t.Any]], None],
+        *args,
+        **kwargs,
+    ) -> ParsedChatCompletionMessage | ChatCompletionMessage:
+        """
+        Fetch a completion from the chat model, token by token.
+        `on_partial` is called with the fields of the explanation parsed so far.
+        """
+        self._check_validation()
+        messages = self._messages(query)
+        estimated = self._acquire(messages)
         try:
-            response = self.client.beta.chat.completions.parse(
-                model=self.model,
-                messages=messages,
-                response_format=Explanation,
-                **kwargs,
+            result = self.backend.stream(
+                self.model, messages, Explanation, on_partial, **kwargs
             )
         except openai.APIError:
             logger.exception("API error encountered.")
@@ -232,7 +300,22 @@ class OpenAIWrapper:
             logger.exception("Input prompt has too many tokens.")
             raise
         else:
-            return response.choices[0].message
+            get_rate_limiter().record_usage(estimated, result.total_tokens)
+            return result.message
+
+    @staticmethod
+    def _acquire(messages: list[ChatCompletionMessageParam]) -> int:
+        """Wait for the kernel's rate limits to allow the request, and return its estimated tokens"""
+        estimated = estimate_tokens(
+            "".join(str(message.get("content") or "") for message in messages)
+        )
+        get_rate_limiter().acquire(estimated)
+        return estimated
+
+
+def to_html(text: t.Any) -> str:
+    """Markdown to HTML converter"""
+    return md.markdown(str(text))
 
 
 class ButtonState(Enum):
@@ -243,96 +326,101 @@ class ButtonState(Enum):
     WAIT = "waiting"
 
 
+AI_EXPLANATION_STYLES = stylesheets.register(
+    "ai-explanation",
+    """
+    .ai-container {
+        margin-top: 1.5rem;
+        font-family: system-ui, -apple-system, sans-serif;
+    }
+    .ai-header {
+        display: flex;
+        align-items: center;
+        gap: 0.75rem;
+        margin-bottom: 1rem;
+    }
+    .ai-title {
+        font-size: 1.1rem;
+        font-weight: 500;
+    }
+    .ai-button {
+        background-color: #4b88ff;
+        color: white;
+        border: none;
+        padding: 0;
+        border-radius: 0.5rem;
+        font-weight: 500;
+        transition: all 0.2s ease;
+        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
+        min-width: 200px;
+        white-space: nowrap;
+        text-overflow: ellipsis;
+        overflow: hidden;
+    }
+    .ai-button:hover:not(:disabled) {
+        background-color: #3b7bff;
+        transform: translateY(-1px);
+        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.15);
+    }
+    .ai-button:disabled {
+        background-color: #94a3b8;
+        cursor: not-allowed;
+        transform: none;
+        box-shadow: none;
+    }
+    .ai-timer {
+        font-size: 0.9rem;
+        color: #64748b;
+        margin-left: 1rem;
+        font-weight: 500;
+    }
+    .ai-content {
+        margin-top: 1rem;
+        border: 1px solid #e5e7eb;
+        border-radius: 0.5rem;
+        overflow: hidden;
+    }
+    .ai-explanation h3 {
+        margin: 0 0 1rem 0;
+        font-size: 1.1rem;
+        color: #1f2937;
+    }
+    .ai-explanation .jupyter-widgets.accordion {
+        margin: 0.75rem 0;
+        border: 1px solid #e5e7eb;
+        border-radius: 0.375rem;
+        overflow: hidden;
+    }
+    .ai-explanation .jupyter-widgets.accordion > .accordion-header {
+        background: #f9fafb;
+        padding: 0.75rem 1rem;
+        font-weight: 500;
+    }
+    .ai-explanation .jupyter-widgets.accordion > .accordion-content {
+        padding: 1rem;
+        background: white;
+    }
+    .ai-explanation code {
+        background: #f3f4f6;
+        padding: 0.2rem 0.4rem;
+        border-radius: 0.25rem;
+        font-size: 0.9em;
+    }
+    .ai-explanation pre {
+        background: #f8f9fa;
+        padding: 1rem;
+        border-radius: 0.375rem;
+        overflow-x: auto;
+    }
+""",
+)
+
+
 class AIExplanation:
     """Class representing an AI-generated explanation"""
 
-    _STYLES = """
-        <style>
-            .ai-container {
-                margin-top: 1.5rem;
-                font-family: system-ui, -apple-system, sans-serif;
-            }
-            .ai-header {
-                display: flex;
-                align-items: center;
-                gap: 0.75rem;
-                margin-bottom: 1rem;
-            }
-            .ai-title {
-                font-size: 1.1rem;
-                font-weight: 500;
-            }
-            .ai-button {
-                background-color: #4b88ff;
-                color: white;
-                border: none;
-                padding: 0;
-                border-radius: 0.5rem;
-                font-weight: 500;
-                transition: all 0.2s ease;
-                box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-                min-width: 200px;
-                white-space: nowrap;
-                text-overflow: ellipsis;
-                overflow: hidden;
-            }
-            .ai-button:hover:not(:disabled) {
-                background-color: #3b7bff;
-                transform: translateY(-1px);
-                box-shadow: 0 4px 6px rgba(0, 0, 0, 0.15);
-            }
-            .ai-button:disabled {
-                background-color: #94a3b8;
-                cursor: not-allowed;
-                transform: none;
-                box-shadow: none;
-            }
-            .ai-timer {
-                font-size: 0.9rem;
-                color: #64748b;
-                margin-left: 1rem;
-                font-weight: 500;
-            }
-            .ai-content {
-                margin-top: 1rem;
-                border: 1px solid #e5e7eb;
-                border-radius: 0.5rem;
-                overflow: hidden;
-            }
-            .ai-explanation h3 {
-                margin: 0 0 1rem 0;
-                font-size: 1.1rem;
-                color: #1f2937;
-            }
-            .ai-explanation .jupyter-widgets.accordion {
-                margin: 0.75rem 0;
-                border: 1px solid #e5e7eb;
-                border-radius: 0.375rem;
-                overflow: hidden;
-            }
-            .ai-explanation .jupyter-widgets.accordion > .accordion-header {
-                background: #f9fafb;
-                padding: 0.75rem 1rem;
-                font-weight: 500;
-            }
-            .ai-explanation .jupyter-widgets.accordion > .accordion-content {
-                padding: 1rem;
-                background: white;
-            }
-            .ai-explanation code {
-                background: #f3f4f6;
-                padding: 0.2rem 0.4rem;
-                border-radius: 0.25rem;
-                font-size: 0.9em;
-            }
-            .ai-explanation pre {
-                background: #f8f9fa;
-                padding: 1rem;
-                border-radius: 0.375rem;
-                overflow-x: auto;
-            }
-        </style>
-    """
+    # Seconds between two updates of the explanation being received
+    PREVIEW_INTERVAL = 0.1
 
     def __init__(
         self,
@@ -349,11 +437,9 @@ class AIExplanation:
         # The output widget for displaying the explanation
         self._output = widgets.Output()
 
-        # Timer and state
-        self._timer: Timer | None = None
-        self._is_throttled = False
+        # Seconds between two explanations of this widget, on top of the kernel's rate limits
         self._wait_time = float(wait_time)
-        self._remaining_time = float(wait_time)
+        self._available_at = 0.0
 
         # The button widget for fetching the explanation
         self._button_styles = {
@@ -412,11 +498,10 @@ class AIExplanation:
         self._button = widgets.Button()
         self._update_button_state(ButtonState.READY)
         self._button.on_click(self._handle_click)
-        self._button.observe(self._handle_state_change, names=["disabled"])
 
     def render(self) -> widgets.Widget:
         """Return a single widget containing all the components"""
-        style_html = widgets.HTML(self._STYLES)
+        styles = stylesheets.html(AI_EXPLANATION_STYLES)
 
         header_html = widgets.HTML(
             '<div class="ai-header">'
@@ -435,7 +520,7 @@ class AIExplanation:
         # Create the rendered container
         container = widgets.VBox(
             children=[
-                style_html,
+                *([widgets.HTML(styles)] if styles else []),
                 header_html,
                 button_container,
                 self._output,
@@ -463,11 +548,14 @@ class AIExplanation:
             logger.exception("Missing key in query parameter")
             raise ValueError from e
 
-    def _update_remaining_time(self):
-        """Update the button label with remaining time"""
-        self._remaining_time = max(0, self._remaining_time - 1)
-        if self._is_throttled:
-            self._update_button_state(ButtonState.WAIT)
+    @property
+    def _remaining_time(self) -> float:
+        """Seconds until the button can be clicked again"""
+        return max(
+            self._available_at - time.monotonic(),
+            get_rate_limiter().wait_time(),
+            0.0,
+        )
 
     def _update_button_state(self, state: ButtonState) -> None:
         """Update the button state"""
@@ -478,7 +566,7 @@ class AIExplanation:
         if state == ButtonState.WAIT:
             self._timer_display.value = (
                 '<span class="ai-timer">Available in '
-                f"{int(self._remaining_time)} "
+                f"{math.ceil(self._remaining_time)} "
                 "seconds</span>"
             )
         else:
@@ -489,47 +577,58 @@ class AIExplanation:
         self._button.icon = style["icon"]
         self._button.disabled = style["disabled"]
 
-    def _handle_state_change(self, change):
-        """Handle the state change of the button"""
-        if change["new"]:
-            if self._is_throttled:
-                self._update_button_state(ButtonState.WAIT)
+    def _wait_or_ready(self) -> None:
+        """Count down until the next explanation is allowed, or enable the button"""
+        if self._remaining_time > 0:
+            self._update_button_state(ButtonState.WAIT)
+            countdowns.add(self)
         else:
-            self._is_throttled = False
             self._update_button_state(ButtonState.READY)
 
-    def _enable_button(self):
-        """Enable the button after a delay"""
-        self._button.disabled = False
-        self._timer = None
-        self._remaining_time = self._wait_time
+    def tick(self) -> bool:
+        """Called every second by the shared countdown: return whether to keep counting down"""
+        if self._current_state != ButtonState.WAIT:
+            return False
+        self._wait_or_ready()
+        return self._current_state == ButtonState.WAIT
 
     def _handle_click(self, _) -> None:
         """Handle the button click event with throttling"""
-        if self._is_throttled:
-            self._update_button_state(ButtonState.WAIT)
+        if self._current_state != ButtonState.READY:
+            return
+        if self._remaining_time > 0:
+            self._wait_or_ready()
             return
 
-        self._is_throttled = True
-        self._button.disabled = True
-        self._remaining_time = self._wait_time
-
-        def update_timer():
-            if self._remaining_time > 0:
-                self._update_remaining_time()
-                self._timer = Timer(1, update_timer)
-                self._timer.start()
-            else:
-                self._enable_button()
-
-        self._timer = Timer(1.0, update_timer)
-        self._timer.start()
+        self._available_at = time.monotonic() + self._wait_time
+        self._update_button_state(ButtonState.LOADING)
 
-        # Call the method to fetch the explanation
-        self._fetch_explanation()
+        # Fetch the explanation without blocking the kernel
+        threading.Thread(
+            target=self._fetch_explanation, name="ai-explanation", daemon=True
+        ).start()
+
+    def _show(self, widget: widgets.Widget) -> None:
+        """Replace the content of the output, from any thread"""
+        # Unlike `with self._output`, setting the outputs does not depend on the executing cell
+        self._output.outputs = ()
+        self._output.append_display_data(widget)
+
+    def _preview_html(self, parsed: dict[str, t.Any]) -> str:
+        """The summary and the steps of an explanation still being received"""
+        html = f"<h3>{to_html(parsed.get('summary') or '')}</h3>"
+        for i, step in enumerate(parsed.get("steps") or [], start=1):
+            if not isinstance(step, dict):
+                continue
+            html += (
+                f"<h4>{to_html(step.get('title') or f'Step {i}')}</h4>"
+                f"{to_html(step.get('content') or '')}"
+            )
+        return f'<div class="ai-explanation">{html}</div>'
 
     def _fetch_explanation(self) -> None:
-        """Fetch the explanation from OpenAI API"""
+        """Fetch the explanation from OpenAI API, or from the cache"""
+        from .explanation_cache import explanation_key, get_explanation_cache
         from .helpers import IPytestOutcome
 
         logger.debug("Attempting to fetch explanation from OpenAI API.")
@@ -545,71 +644,98 @@ class AIExplanation:
         else:
             traceback_str = "No traceback available."
 
-        with self._output:
-            self._output.clear_output()
+        self._output.outputs = ()
 
-            try:
-                # assert self.ipytest_result.function is not None
-                match self.ipytest_result.status:
-                    case IPytestOutcome.FINISHED if (
-                        self.ipytest_result.function is not None
-                    ):
-                        self.query_params(
-                            function_code=self.ipytest_result.function.source_code,
-                            docstring=self.ipytest_result.function.implementation.__doc__,
-                            traceback=traceback_str,
-                        )
-                    case _:
-                        self.query_params(
-                            function_code=self.ipytest_result.cell_content,
-                            docstring="(Find it in the function's definition above.)",
-                            traceback=traceback_str,
-                        )
-
-                response = self.openai_client.get_chat_response(
+        try:
+            match self.ipytest_result.status:
+                case IPytestOutcome.FINISHED if (
+                    self.ipytest_result.function is not None
+                ):
+                    self.query_params(
+                        function_code=self.ipytest_result.function.source_code,
+                        docstring=self.ipytest_result.function.implementation.__doc__,
+                        traceback=traceback_str,
+                    )
+                case _:
+                    self.query_params(
+                        function_code=self.ipytest_result.cell_content,
+                        docstring="(Find it in the function's definition above.)",
+                        traceback=traceback_str,
+                    )
+
+            # Identical failures on the same exercise get the same explanation
+            cache = get_explanation_cache()
+            key = explanation_key(
+                self._query_params["function_code"],
+                self.exception,
+                self.openai_client.model,
+                self.openai_client.language,
+                self.ipytest_result.test_attempts,
+            )
+            response: (
+                Explanation | ParsedChatCompletionMessage | ChatCompletionMessage | None
+            ) = cache.get(key) if cache is not None else None
+
+            if response is None:
+                # Show the summary and the steps as they arrive
+                preview = widgets.HTML()
+                self._show(preview)
+                last_update = 0.0
+
+                def on_partial(parsed: dict[str, t.Any]) -> None:
+                    nonlocal last_update
+                    if time.monotonic() - last_update >= self.PREVIEW_INTERVAL:
+                        preview.value = self._preview_html(parsed)
+                        last_update = time.monotonic()
+
+                response = self.openai_client.stream_chat_response(
                     self.query,
+                    on_partial,
                     temperature=0.2,
                 )
+                if (
+                    cache is not None
+                    and isinstance(response, ParsedChatCompletionMessage)
+                    and isinstance(response.parsed, Explanation)
+                ):
+                    cache.put(key, response.parsed)
 
-                logger.debug("Received response: %s", response)
+            logger.debug("Received response: %s", response)
 
-                formatted_response = self._format_explanation(response)
+            formatted_response = self._format_explanation(response)
 
-                logger.debug("Formatted response: %s", formatted_response)
+            logger.debug("Formatted response: %s", formatted_response)
 
-                if formatted_response:
-                    display(widgets.VBox(children=formatted_response))
-                else:
-                    display(widgets.HTML("<p>No explanation could be generated.</p>"))
-            except Exception as e:
-                logger.exception("An error occurred while fetching the explanation.")
-                display_html(f"<p>Failed to fetch explanation: {e}</p>", raw=True)
-            finally:
-                if self._is_throttled:
-                    self._update_button_state(ButtonState.WAIT)
-                else:
-                    self._update_button_state(ButtonState.READY)
+            if formatted_response:
+                self._show(widgets.VBox(children=formatted_response))
+            else:
+                self._show(widgets.HTML("<p>No explanation could be generated.</p>"))
+        except Exception as e:
+            logger.exception("An error occurred while fetching the explanation.")
+            self._show(widgets.HTML(f"<p>Failed to fetch explanation: {e}</p>"))
+        finally:
+            self._wait_or_ready()
 
     def _format_explanation(
-        self, chat_response: ParsedChatCompletionMessage | ChatCompletionMessage
+        self,
+        chat_response: Explanation
+        | ParsedChatCompletionMessage
+        | ChatCompletionMessage,
     ) -> list[t.Any] | None:
         """Format the explanation response for display"""
 
-        # Initialize the Markdown to HTML converter
-        def to_html(text: t.Any) -> str:
-            """Markdown to HTML converter"""
-            return md.markdown(str(text))
-
         # Reset the explanation object
         explanation = None
 
         # A list to store all the widgets
         widgets_list = []
 
-        if (
+        if isinstance(chat_response, Explanation) or (
             isinstance(chat_response, ParsedChatCompletionMessage)
             and (explanation := chat_response.parsed) is not None
         ):
+            if isinstance(chat_response, Explanation):
+                explanation = chat_response
             logger.debug("Response is a valid `Explanation` object that can be parsed.")
 
             # A summary of the explanation
@@ -1,5 +1,61 @@
 import ast
+import functools
 import pathlib
+import threading
+
+
+class FunctionSourceIndex:
+    """
+    Index of the source code of functions, by fully qualified name (e.g., `tutorial.module.function`).
+    A module is parsed the first time one of its functions is requested,
+    and parsed again only when its file changes.
+    """
+
+    def __init__(self) -> None:
+        # Module file -> (mtime, function name -> source code)
+        self._modules: dict[pathlib.Path, tuple[int, dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def module_file(module: str) -> pathlib.Path | None:
+        """The file of a module, relative to the working directory, if it exists"""
+        module_path = pathlib.Path(module.replace(".", "/"))
+        for candidate in (module_path.with_suffix(".py"), module_path / "__init__.py"):
+            if candidate.is_file():
+                return candidate.resolve()
+        return None
+
+    def module_functions(self, module: str) -> dict[str, str]:
+        """The source code of all the top-level functions of a module"""
+        if (module_file := self.module_file(module)) is None:
+            return {}
+
+        mtime_ns = module_file.stat().st_mtime_ns
+
+        with self._lock:
+            if (entry := self._modules.get(module_file)) is not None and (
+                entry[0] == mtime_ns
+            ):
+                return entry[1]
+
+            tree = ast.parse(module_file.read_text(encoding="utf-8"))
+            functions = {
+                node.name: ast.unparse(node)
+                for node in tree.body
+                if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef)
+            }
+            self._modules[module_file] = (mtime_ns, functions)
+
+        return functions
+
+    def get(self, qualified_name: str) -> str | None:
+        """The source code of a function, or `None` if it cannot be found"""
+        module, _, name = qualified_name.rpartition(".")
+        return self.module_functions(module).get(name) if module else None
+
+
+# Shared by all the parsers of a kernel
+function_sources = FunctionSourceIndex()
 
 
 class AstParser:
@@ -7,58 +63,59 @@ class AstParser:
     Helper class for extraction of function definitions and imports.
     To find all reference solutions:
     Parse the module file using the AST module and retrieve all function definitions and imports.
-    For each reference solution store the names of all other functions used inside of it.
+    Build the call graph of the module in a single pass, then store for each reference solution
+    the names of all other functions used inside of it, directly or not.
     """
 
     def __init__(self, module_file: pathlib.Path) -> None:
         self.module_file = module_file
-        self.function_defs = {}
-        self.function_imports = {}
-        self.called_function_names = {}
+        self.function_defs: dict[str, ast.FunctionDef | ast.AsyncFunctionDef] = {}
+        self.function_imports: dict[str, str] = {}
+        self.called_function_names: dict[str, set[str]] = {}
+        self._solution_code: dict[str, str] = {}
 
         tree = ast.parse(self.module_file.read_text(encoding="utf-8"))
 
         for node in tree.body:
             if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef):
                 self.function_defs[node.name] = node
-            elif isinstance(node, ast.Import | ast.ImportFrom) and hasattr(
-                node, "module"
-            ):
+            elif isinstance(node, ast.ImportFrom) and node.module is not None:
                 for n in node.names:
                     self.function_imports[n.name] = node.module
 
-        for node in tree.body:
-            if (
-                node in self.function_defs.values()
-                and hasattr(node, "name")
-                and node.name.startswith("reference_")
-            ):
-                self.called_function_names[node.name] = self.retrieve_functions(
-                    {**self.function_defs, **self.function_imports}, node, {node.name}
+        # Each function body is walked exactly once
+        call_graph = {
+            name: self.called_names(node) for name, node in self.function_defs.items()
+        }
+
+        for name in self.function_defs:
+            if name.startswith("reference_"):
+                self.called_function_names[name] = self.transitive_calls(
+                    call_graph, name
                 )
 
-    def retrieve_functions(
-        self, all_functions: dict, node: object, called_functions: set[object]
-    ) -> set[object]:
-        """
-        Recursively walk the AST tree to retrieve all function definitions in a file
-        """
+    @staticmethod
+    def called_names(node: ast.AST) -> set[str]:
+        """Names of all the functions called by name inside a node"""
+        return {
+            n.func.id
+            for n in ast.walk(node)
+            if isinstance(n, ast.Call) and isinstance(n.func, ast.Name)
+        }
+
+    @staticmethod
+    def transitive_calls(call_graph: dict[str, set[str]], name: str) -> set[str]:
+        """All the names reachable from `name` in the call graph, including itself"""
+        reachable = {name}
+        to_visit = [name]
 
-        if isinstance(node, ast.AST):
-            for n in ast.walk(node):
-                match n:
-                    case ast.Call(ast.Name(id=name)):
-                        called_functions.add(name)
-                        if name in all_functions:
-                            called_functions = self.retrieve_functions(
-                                all_functions, all_functions[name], called_functions
-                            )
-                for child in ast.iter_child_nodes(n):
-                    called_functions = self.retrieve_functions(
-                        all_functions, child, called_functions
-                    )
-
-        return called_functions
+        while to_visit:
+            for callee in call_graph.get(to_visit.pop(), ()):
+                if callee not in reachable:
+                    reachable.add(callee)
+                    to_visit.append(callee)
+
+        return reachable
 
     def get_solution_code(self, name: str) -> str:
         """
@@ -66,26 +123,37 @@ class AstParser:
         Create a str containing its code and the code of all other functions used,
         whether coming from the same file or an imported one.
         """
+        if name in self._solution_code:
+            return self._solution_code[name]
 
         solution_functions = self.called_function_names[f"reference_{name}"]
         solution_code = ""
 
-        for f in solution_functions:
-            if f in self.function_defs:
-                solution_code += ast.unparse(self.function_defs[f]) + "\n\n"
-            elif f in self.function_imports:
-                function_file = pathlib.Path(
-                    f"{self.function_imports[f].replace('.', '/')}.py"
-                )
-                if function_file.exists():
-                    function_file_tree = ast.parse(
-                        function_file.read_text(encoding="utf-8")
-                    )
-                    for node in function_file_tree.body:
-                        if (
-                            isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef)
-                            and node.name == f
-                        ):
-                            solution_code += ast.unparse(node) + "\n\n"
+        # Imported functions first, then the module's ones in the order they are defined
+        for f in sorted(solution_functions & self.function_imports.keys()):
+            if (
+                source := function_sources.get(f"{self.function_imports[f]}.{f}")
+            ) is not None:
+                solution_code += source + "\n\n"
+
+        for f, node in self.function_defs.items():
+            if f in solution_functions:
+                solution_code += ast.unparse(node) + "\n\n"
 
+        self._solution_code[name] = solution_code
         return solution_code
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_ast_parser(module_file: pathlib.Path, mtime_ns: int) -> AstParser:
+    return AstParser(module_file)
+
+
+def get_ast_parser(module_file: pathlib.Path) -> AstParser:
+    """Return a parser of the module, parsed again only if the file changed"""
+    return _cached_ast_parser(module_file.resolve(), module_file.stat().st_mtime_ns)
+
+
+def get_solution_code(module_file: pathlib.Path, name: str) -> str:
+    """Shortcut to get the solution code of a function from a test module"""
+    return get_ast_parser(module_file).get_solution_code(name)
@@ -0,0 +1,307 @@
+"""
+A module to check that every reference solution passes its own tests, and how fast.
+
+Each `reference_<name>` function of a test module is tested like a solution named
+`solution_<name>`. The timings are compared with a baseline file, to flag the tests
+that fail and the ones that became slower:
+
+    python -m tutorial.tests.testsuite benchmark --update    # record the baseline
+    python -m tutorial.tests.testsuite benchmark             # compare with it
+"""
+
+import argparse
+import collections
+import json
+import os
+import pathlib
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+import pytest
+
+from .helpers import AFunction, IPytestOutcome, RunOptions
+from .limits import DEFAULT_TIMEOUT, ResourceLimits
+from .session import TestModuleSession, get_test_session
+from .workers import process_context
+
+DEFAULT_BASELINE = pathlib.Path("tutorial/tests/benchmark.json")
+
+# A test is slower if it takes that many times its baseline duration...
+DEFAULT_THRESHOLD = 1.5
+# ... and if it takes longer than that, in seconds: shorter tests are too noisy
+DEFAULT_MIN_DURATION = 0.01
+
+
+def reference_functions(session: TestModuleSession) -> dict[str, AFunction]:
+    """The reference solutions of a collected test module, by the name of the exercise"""
+    module = next(
+        (
+            item.module
+            for item in session.session.items
+            if isinstance(item, pytest.Function)
+        ),
+        None,
+    )
+    if module is None:
+        return {}
+
+    return {
+        name.removeprefix("reference_"): AFunction(
+            name=name.removeprefix("reference_"),
+            implementation=value,
+            source_code=None,
+        )
+        for name, value in vars(module).items()
+        if name.startswith("reference_")
+        and callable(value)
+        and getattr(value, "__module__", None) == module.__name__
+    }
+
+
+def benchmark_module(
+    module_file: pathlib.Path, options: RunOptions, repeats: int = 3
+) -> list[dict[str, Any]]:
+    """
+    Test the reference solutions of a module, and keep the shortest duration of each test.
+    A module that cannot be collected, e.g., because of a missing dependency, gives a single row.
+    """
+    from .testsuite import run_pytest_for_function
+
+    module = module_file.stem.removeprefix("test_")
+    references: dict[str, AFunction] = {}
+    try:
+        session = get_test_session(module_file)
+    except Exception as err:
+        error = type(err).__name__
+    else:
+        if session.collection_failed:
+            error = "COLLECTION_ERROR"
+        else:
+            references = reference_functions(session)
+            error = None if references else "NO_REFERENCES"
+
+    if error is not None:
+        return [
+            {
+                "module": module,
+                "function": None,
+                "test": None,
+                "outcome": error,
+                "duration": None,
+            }
+        ]
+
+    rows: dict[str, dict[str, Any]] = {}
+    for name, function in references.items():
+        for _ in range(repeats):
+            result = run_pytest_for_function(module_file, function, options=options)
+
+            if result.status == IPytestOutcome.NO_TEST_FOUND:
+                # A helper of the tests, not the solution of an exercise
+                break
+
+            if not result.test_results:
+                rows[name] = {
+                    "module": module,
+                    "function": name,
+                    "test": None,
+                    "outcome": result.status.name if result.status else None,
+                    "duration": None,
+                }
+                break
+
+            for test in result.test_results:
+                row = rows.setdefault(
+                    test.test_name,
+                    {
+                        "module": module,
+                        "function": name,
+                        "test": test.test_name,
+                        "outcome": test.outcome.name,
+                        "duration": test.duration,
+                    },
+                )
+                # A test that fails once is a failing test
+                if test.outcome.name != "PASS":
+                    row["outcome"] = test.outcome.name
+                if test.duration is not None and (
+                    row["duration"] is None or test.duration < row["duration"]
+                ):
+                    row["duration"] = test.duration
+
+    return list(rows.values())
+
+
+def run_benchmark(
+    tests_dir: pathlib.Path,
+    options: RunOptions,
+    workers: int,
+    repeats: int = 3,
+) -> list[dict[str, Any]]:
+    """Benchmark the test modules of a directory, one process per module"""
+    module_files = sorted(tests_dir.glob("test_*.py"))
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=process_context([f"{__package__}.testsuite"]),
+        # A fresh process per module: the modules cannot slow down each other
+        max_tasks_per_child=1,
+    ) as executor:
+        results = executor.map(
+            benchmark_module,
+            module_files,
+            [options] * len(module_files),
+            [repeats] * len(module_files),
+        )
+        return [row for rows in results for row in rows]
+
+
+def _key(row: dict[str, Any]) -> str:
+    return row["test"] or f"{row['module']}::{row['function'] or ''}"
+
+
+def compare(
+    rows: list[dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+    min_duration: float = DEFAULT_MIN_DURATION,
+) -> list[str]:
+    """The failing tests, and the ones slower than their baseline"""
+    problems = []
+    for row in rows:
+        key = _key(row)
+        previous = baseline.get(key, {})
+
+        if row["outcome"] != "PASS":
+            # A test that already failed in the baseline is a known failure, not a regression
+            if previous.get("outcome") == row["outcome"]:
+                continue
+            problems.append(f"FAIL {key}: {row['outcome']}")
+            continue
+
+        duration, reference = row["duration"], previous.get("duration")
+        if (
+            duration is not None
+            and reference
+            and duration > min_duration
+            and duration > threshold * reference
+        ):
+            problems.append(
+                f"SLOW {key}: {duration * 1000:.1f} ms, "
+                f"{duration / reference:.1f}x the baseline of {reference * 1000:.1f} ms"
+            )
+
+    return problems
+
+
+def read_baseline(path: pathlib.Path) -> dict[str, dict[str, Any]]:
+    """The rows of a baseline file, by test"""
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8")).get("tests", {})
+
+
+def write_baseline(path: pathlib.Path, rows: list[dict[str, Any]]) -> None:
+    path.write_text(
+        json.dumps(
+            {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "tests": {_key(row): row for row in rows},
+            },
+            indent=2,
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+
+
+def exercise_budgets(rows: list[dict[str, Any]]) -> dict[str, float]:
+    """The total duration of the tests of each exercise, in seconds"""
+    budgets: dict[str, float] = collections.defaultdict(float)
+    for row in rows:
+        if row["function"] is not None:
+            budgets[f"{row['module']}::{row['function']}"] += row["duration"] or 0.0
+    return dict(budgets)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The arguments of the `benchmark` command"""
+    parser.add_argument(
+        "--tests",
+        type=pathlib.Path,
+        default=pathlib.Path("tutorial/tests"),
+        help="directory of the test modules",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=pathlib.Path,
+        default=DEFAULT_BASELINE,
+        help="baseline file of the test timings",
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="write the timings to the baseline file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="flag the tests slower than this many times their baseline",
+    )
+    parser.add_argument(
+        "--min-duration",
+        type=float,
+        default=DEFAULT_MIN_DURATION,
+        help="ignore the slowdowns of tests shorter than this, in seconds",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="runs of each test, the best is kept"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of test modules run at the same time",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="time limit of each test, in seconds, instead of its `timeout` marker"
+        f" or the default of {DEFAULT_TIMEOUT:g}",
+    )
+
+
+def main(args: argparse.Namespace) -> int:
+    """Benchmark the reference solutions, and fail if some regressed"""
+    rows = run_benchmark(
+        args.tests.resolve(),
+        RunOptions(
+            limits=ResourceLimits.from_env().with_options(
+                {"timeout": str(args.timeout)} if args.timeout is not None else {}
+            )
+        ),
+        workers=max(1, args.workers),
+        repeats=max(1, args.repeats),
+    )
+
+    for exercise, budget in sorted(exercise_budgets(rows).items()):
+        print(f"{exercise}: {budget * 1000:.1f} ms")
+
+    failing = sum(row["outcome"] != "PASS" for row in rows)
+    print(f"{len(rows)} tests, {failing} not passing")
+
+    problems = compare(
+        rows, read_baseline(args.baseline), args.threshold, args.min_duration
+    )
+    for problem in problems:
+        print(problem, file=sys.stderr)
+
+    if args.update:
+        write_baseline(args.baseline, rows)
+        print(f"Baseline written to {args.baseline}")
+
+    return 1 if problems else 0
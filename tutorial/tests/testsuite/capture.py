@@ -0,0 +1,110 @@
+"""A module to keep the output printed by the tests within a size budget"""
+
+import atexit
+import dataclasses
+import os
+import pathlib
+import shutil
+import tempfile
+import uuid
+
+# Largest output of a test sent to the front end, in bytes
+DEFAULT_OUTPUT_BYTES = 16 * 1024
+
+
+def max_output_bytes() -> int:
+    """The output budget of a test, configured with `IPYTEST_MAX_OUTPUT_BYTES`"""
+    return max(0, int(os.getenv("IPYTEST_MAX_OUTPUT_BYTES", DEFAULT_OUTPUT_BYTES)))
+
+
+def output_directory() -> pathlib.Path:
+    """
+    The directory of the full outputs that did not fit in the budget.
+    It is created once per kernel, and the worker processes inherit it.
+    """
+    if directory := os.getenv("IPYTEST_OUTPUT_DIR"):
+        return pathlib.Path(directory)
+
+    directory = tempfile.mkdtemp(prefix="ipytest-output-")
+    os.environ["IPYTEST_OUTPUT_DIR"] = directory
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return pathlib.Path(directory)
+
+
+@dataclasses.dataclass(frozen=True)
+class CapturedOutput:
+    """The output of a test, reduced to its head and tail if it is too large"""
+
+    head: str = ""
+    tail: str = ""
+    # Size of the full output, in bytes
+    size: int = 0
+    # Where the full output was saved, if it did not fit in the budget
+    spill_file: str | None = None
+
+    @classmethod
+    def from_text(cls, text: str, max_bytes: int | None = None) -> "CapturedOutput":
+        """Keep the head and the tail of a text, and save all of it if it is too large"""
+        if max_bytes is None:
+            max_bytes = max_output_bytes()
+
+        data = text.encode("utf-8", "replace")
+        if len(data) <= max_bytes:
+            return cls(head=text, size=len(data))
+
+        spill_file = output_directory() / f"{uuid.uuid4().hex}.txt"
+        try:
+            spill_file.write_bytes(data)
+        except OSError:
+            spill_file = None
+
+        half = max_bytes // 2
+        return cls(
+            head=data[:half].decode("utf-8", "ignore"),
+            tail=data[len(data) - half :].decode("utf-8", "ignore") if half else "",
+            size=len(data),
+            spill_file=str(spill_file) if spill_file else None,
+        )
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > len(self.head.encode("utf-8")) + len(
+            self.tail.encode("utf-8")
+        )
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __str__(self) -> str:
+        if not self.truncated:
+            return self.head
+
+        omitted = (
+            self.size - len(self.head.encode("utf-8")) - len(self.tail.encode("utf-8"))
+        )
+        where = f", the full output is in {self.spill_file}" if self.spill_file else ""
+        return f"{self.head}\n\n... {omitted} bytes not shown{where} ...\n\n{self.tail}"
+
+    @property
+    def saved(self) -> bool:
+        """Whether the full output is still in its file"""
+        return self.spill_file is not None and os.path.exists(self.spill_file)
+
+    def read(self, offset: int = 0, size: int = -1) -> str:
+        """
+        `size` bytes of the full output from `offset`, if it was saved and still exists,
+        or the part that was kept
+        """
+        if self.spill_file is not None:
+            try:
+                with open(self.spill_file, "rb") as file:
+                    file.seek(offset)
+                    return file.read(size).decode("utf-8", "replace")
+            except OSError:
+                pass
+        return str(self)
+
+    def remove(self) -> None:
+        """Delete the saved full output, e.g., when the cell that printed it runs again"""
+        if self.spill_file is not None:
+            pathlib.Path(self.spill_file).unlink(missing_ok=True)
@@ -0,0 +1,105 @@
+"""A module to check the time complexity of a solution by measuring it"""
+
+import math
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import pytest
+
+# Runs shorter than this are too noisy to be used in the fit, in seconds
+MIN_MEASURABLE_TIME = 1e-4
+
+
+@dataclass
+class ComplexityMeasurement:
+    """The running times of a function on inputs of growing sizes"""
+
+    sizes: list[int] = field(default_factory=list)
+    times: list[float] = field(default_factory=list)
+
+    @property
+    def exponent(self) -> float | None:
+        """The slope of the log-log fit of the time against the size, e.g., 2 for O(n^2)"""
+        points = [
+            (math.log(size), math.log(duration))
+            for size, duration in zip(self.sizes, self.times, strict=True)
+            if duration >= MIN_MEASURABLE_TIME
+        ]
+        if len(points) < 3:
+            return None
+
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        variance = sum((x - mean_x) ** 2 for x, _ in points)
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in points)
+        return covariance / variance
+
+
+def measure_complexity(
+    function: Callable[..., Any],
+    generate: Callable[[int], Any],
+    min_size: int = 100,
+    max_size: int = 100_000,
+    growth: float = 2.0,
+    repeats: int = 3,
+    time_budget: float = 5.0,
+) -> ComplexityMeasurement:
+    """
+    Time `function` on the inputs returned by `generate(size)`, for sizes growing geometrically.
+    Each size keeps the best of `repeats` runs, and no larger size is tried once the time budget is spent.
+    """
+    measurement = ComplexityMeasurement()
+    deadline = time.perf_counter() + time_budget
+    size = min_size
+
+    while size <= max_size:
+        best = math.inf
+        for _ in range(repeats):
+            # A fresh input each time, in case the function modifies it
+            data = generate(size)
+            start = time.perf_counter()
+            function(data)
+            best = min(best, time.perf_counter() - start)
+
+        measurement.sizes.append(size)
+        measurement.times.append(best)
+
+        # The next size would take at least twice as long: stop if it cannot fit
+        remaining = deadline - time.perf_counter()
+        if remaining < best * growth * repeats:
+            break
+        size = int(size * growth)
+
+    return measurement
+
+
+@pytest.fixture
+def check_complexity() -> Callable[..., ComplexityMeasurement]:
+    """
+    Fail the test if a function is slower than O(n^max_exponent), e.g.:
+
+        check_complexity(function_to_test, lambda n: list(range(n)), max_exponent=1.5)
+    """
+
+    def check(
+        function: Callable[..., Any],
+        generate: Callable[[int], Any],
+        max_exponent: float,
+        **kwargs: Any,
+    ) -> ComplexityMeasurement:
+        measurement = measure_complexity(function, generate, **kwargs)
+
+        if (exponent := measurement.exponent) is not None and exponent > max_exponent:
+            pytest.fail(
+                f"Your solution looks like O(n^{exponent:.1f}) on inputs of "
+                f"{measurement.sizes[0]} to {measurement.sizes[-1]} elements, "
+                f"but O(n^{max_exponent:g}) or better is expected. "
+                "Can you avoid nested loops over the input?",
+                pytrace=False,
+            )
+
+        return measurement
+
+    return check
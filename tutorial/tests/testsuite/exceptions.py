@@ -29,6 +29,72 @@ class PytestInternalError(Exception):
         super().__init__("Pytest internal error")
 
 
+# Derived from `BaseException` so that a solution catching `Exception` cannot swallow them
+class TestTimeoutError(BaseException):
+    """Custom exception raised when a test runs for longer than allowed"""
+
+    __test__ = False
+
+    def __init__(self, seconds: float) -> None:
+        super().__init__(f"The test did not finish within {seconds:g} seconds")
+
+
+class ResourceLimitError(BaseException):
+    """Custom exception raised when a test uses more resources than allowed"""
+
+
+class CPUTimeLimitError(ResourceLimitError):
+    """Custom exception raised when a test uses more CPU time than allowed"""
+
+    def __init__(self, seconds: float) -> None:
+        super().__init__(f"The test used more than {seconds:g} seconds of CPU time")
+
+
+class UnknownLimitError(ValueError):
+    """Custom exception raised when a line option names an unknown resource limit"""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"Unknown resource limit: {name}")
+
+
+class InvalidLimitError(ValueError):
+    """Custom exception raised when a line option gives a resource limit that is not a number"""
+
+    def __init__(self, name: str, value: str) -> None:
+        super().__init__(f"The resource limit {name} should be a number, not {value!r}")
+
+
+class WorkerCrashedError(Exception):
+    """Custom exception raised when a worker process dies while running the tests"""
+
+    def __init__(self) -> None:
+        super().__init__("The test worker stopped unexpectedly")
+
+
+class GlobalNotSendableError(Exception):
+    """Custom exception raised when a global used by a cell cannot be rebuilt in a worker"""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"{name!r} cannot be sent to a worker process")
+
+
+class RemoteTestError(Exception):
+    """Stand-in for an exception raised in a worker process that cannot be pickled"""
+
+    def __init__(self, type_name: str, message: str) -> None:
+        super().__init__(message)
+        self.type_name = type_name
+
+    def __reduce__(self):
+        return rebuild_remote_error, (self.type_name, str(self))
+
+
+def rebuild_remote_error(type_name: str, message: str) -> RemoteTestError:
+    """Create a `RemoteTestError` named after the class of the original exception"""
+    exception_type = type(type_name, (RemoteTestError,), {})
+    return exception_type(type_name, message)
+
+
 class OpenAIWrapperError(Exception):
     """Base exception for OpenAI validation errors"""
 
@@ -41,6 +107,13 @@ class APIConnectionError(OpenAIWrapperError):
     """Connection error"""
 
 
+class ValidationTimeoutError(APIConnectionError):
+    """The validation of the OpenAI configuration did not finish in time"""
+
+    def __init__(self, seconds: float) -> None:
+        super().__init__(f"The validation did not finish within {seconds:g} seconds")
+
+
 class UnexpectedAPIError(OpenAIWrapperError):
     """Unexpected API error"""
 
@@ -0,0 +1,185 @@
+"""
+A module to reuse the AI explanations of identical failures.
+
+The explanations are stored in an SQLite database, shared by all the kernels of a host.
+A failure is identified by the solution's code, ignoring whitespace and comments,
+the exception, the model, the language, and how many attempts were made.
+"""
+
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+
+from pydantic import ValidationError
+
+from .ai_helpers import Explanation
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Seconds to wait for another kernel writing to the cache
+LOCK_TIMEOUT = 5.0
+
+
+def cache_directory() -> pathlib.Path:
+    """The directory of the caches shared by the kernels of a user"""
+    cache_home = os.getenv("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "ipytest"
+
+
+def default_cache_path() -> pathlib.Path:
+    return cache_directory() / "explanations.sqlite3"
+
+
+def normalize_source(source_code: str | None) -> str:
+    """The AST of the code, so that formatting and comments do not change the key"""
+    try:
+        return ast.dump(ast.parse(source_code or ""))
+    except SyntaxError:
+        return (source_code or "").strip()
+
+
+def attempt_bucket(attempt: int) -> int:
+    """The explanations get more detailed after the first attempt, and after the third"""
+    if attempt <= 1:
+        return 0
+    if attempt <= 3:
+        return 1
+    return 2
+
+
+def explanation_key(
+    source_code: str | None,
+    exception: BaseException | None,
+    model: str,
+    language: str,
+    attempt: int,
+) -> str:
+    """The cache key of the explanation of a failure"""
+    message = str(exception) if exception is not None else ""
+    # Object addresses differ between runs of the same code
+    message = re.sub(r"0x[0-9a-fA-F]+", "0x", message)
+
+    return hashlib.sha256(
+        json.dumps(
+            [
+                normalize_source(source_code),
+                type(exception).__name__ if exception is not None else None,
+                message,
+                model,
+                language,
+                attempt_bucket(attempt),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class ExplanationCache:
+    """A size-bounded LRU cache of explanations, that several processes can share"""
+
+    def __init__(self, path: pathlib.Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits on success, and is always closed"""
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        try:
+            with connection:
+                if not self._initialized:
+                    # Readers do not block the writer, e.g., of another kernel
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS explanations ("
+                        "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                        "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+                    )
+                    connection.execute(
+                        "CREATE INDEX IF NOT EXISTS explanations_accessed "
+                        "ON explanations (accessed)"
+                    )
+                    self._initialized = True
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> Explanation | None:
+        """The cached explanation, or `None`. Never raises"""
+        try:
+            with self._lock, self._connect() as connection:
+                row = connection.execute(
+                    "SELECT value FROM explanations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE explanations SET accessed = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            return Explanation.model_validate_json(row[0])
+        except (sqlite3.Error, OSError, ValidationError):
+            return None
+
+    def put(self, key: str, explanation: Explanation) -> None:
+        """Store an explanation, evicting the least recently used ones if needed. Never raises"""
+        value = explanation.model_dump_json()
+        try:
+            with self._lock, self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), time.time()),
+                )
+                # Keep the most recently used explanations that fit in the budget
+                connection.execute(
+                    "DELETE FROM explanations WHERE key IN ("
+                    "SELECT key FROM (SELECT key, SUM(size) OVER "
+                    "(ORDER BY accessed DESC, key) AS total FROM explanations) "
+                    "WHERE total > ?)",
+                    (self.max_bytes,),
+                )
+        except (sqlite3.Error, OSError):
+            pass
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM explanations")
+
+
+_cache: ExplanationCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_explanation_cache() -> ExplanationCache | None:
+    """
+    Return the explanation cache, or `None` if it is disabled.
+    Configured with `IPYTEST_EXPLANATION_CACHE`, a path or `off`, and `IPYTEST_EXPLANATION_CACHE_BYTES`.
+    """
+    global _cache
+
+    path = os.getenv("IPYTEST_EXPLANATION_CACHE")
+    if path is not None and path.lower() in ("", "0", "off"):
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExplanationCache(
+                pathlib.Path(path) if path else default_cache_path(),
+                max_bytes=int(
+                    os.getenv("IPYTEST_EXPLANATION_CACHE_BYTES", DEFAULT_MAX_BYTES)
+                ),
+            )
+
+    return _cache
@@ -0,0 +1,488 @@
+"""
+A module to grade a directory of submitted notebooks without opening them.
+
+Every `%%ipytest` cell of a notebook is run against its test module, and each
+submission is graded in its own process, killed if it runs for too long.
+The rows of the graded submissions are appended to a state file as they finish,
+so that an interrupted run resumes where it stopped:
+
+    python -m tutorial.tests.testsuite grade submissions/ --output gradebook.csv
+"""
+
+import argparse
+import ast
+import csv
+import dataclasses
+import hashlib
+import json
+import multiprocessing
+import os
+import pathlib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing.connection import Connection
+from typing import Any
+
+from .helpers import AFunction, IPytestOutcome, RunOptions, TestOutcome
+from .limits import DEFAULT_TIMEOUT, ResourceLimits
+from .workers import process_context
+
+# Options of the `%%ipytest` line that are not part of the module name
+LINE_FLAGS = frozenset(
+    {
+        "debug",
+        "async",
+        "isolated",
+        "parallel",
+        "stream",
+        "failfast",
+        "ff",
+        "tracemalloc",
+        "profile",
+    }
+)
+
+# Wall-clock time a whole submission may take, in seconds
+DEFAULT_SUBMISSION_TIMEOUT = 300.0
+
+# Time a grading process may take to exit once it sent its results, in seconds
+EXIT_GRACE_PERIOD = 5.0
+
+# Exit code of a process killed by SIGKILL, usually by the out-of-memory killer
+KILLED_EXITCODE = -9
+
+GRADEBOOK_FIELDS = (
+    "submission",
+    "sha256",
+    "module",
+    "function",
+    "status",
+    "passed",
+    "failed",
+    "total",
+    "duration",
+)
+
+
+@dataclasses.dataclass
+class SolutionCell:
+    """The code of a `%%ipytest` cell, and the test module it names"""
+
+    module_name: str | None
+    source_code: str
+    functions: list[str]
+
+
+@dataclasses.dataclass
+class Submission:
+    """A notebook to grade"""
+
+    path: pathlib.Path
+    sha256: str
+
+    @classmethod
+    def from_path(cls, path: pathlib.Path) -> "Submission":
+        return cls(path=path, sha256=hashlib.sha256(path.read_bytes()).hexdigest())
+
+
+def _cell_source(cell: dict[str, Any]) -> str:
+    source = cell.get("source", "")
+    return "".join(source) if isinstance(source, list) else source
+
+
+def _strip_magics(source: str) -> str:
+    """Drop the IPython-only lines that plain Python cannot run, e.g., `%matplotlib` or `!pip`"""
+    return "\n".join(
+        "" if line.lstrip().startswith(("%", "!")) else line
+        for line in source.splitlines()
+    )
+
+
+def _module_from_line(line: str) -> str | None:
+    """The module name of a `%%ipytest` line, ignoring its options"""
+    names = [
+        token
+        for token in line.split()[1:]
+        if token not in LINE_FLAGS and "=" not in token
+    ]
+    return names[0].removesuffix(".py") if names else None
+
+
+def extract_cells(notebook: dict[str, Any]) -> tuple[list[str], list[SolutionCell]]:
+    """
+    Return the imports of a notebook and its `%%ipytest` cells.
+    Only the imports of the other cells are kept: they may run anything else, e.g., wait for input.
+    """
+    imports: list[str] = []
+    cells: list[SolutionCell] = []
+
+    for cell in notebook.get("cells", []):
+        if cell.get("cell_type") != "code":
+            continue
+
+        source = _cell_source(cell)
+        first_line, _, body = source.partition("\n")
+
+        if first_line.startswith("%%ipytest"):
+            body = _strip_magics(body)
+            try:
+                tree = ast.parse(body)
+            except SyntaxError:
+                functions = []
+            else:
+                functions = [
+                    node.name.removeprefix("solution_")
+                    for node in tree.body
+                    if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef)
+                    and node.name.startswith("solution_")
+                ]
+            cells.append(SolutionCell(_module_from_line(first_line), body, functions))
+        elif not first_line.startswith("%%"):
+            try:
+                tree = ast.parse(_strip_magics(source))
+            except SyntaxError:
+                continue
+            imports.extend(
+                ast.unparse(node)
+                for node in tree.body
+                if isinstance(node, ast.Import | ast.ImportFrom)
+            )
+
+    return list(dict.fromkeys(imports)), cells
+
+
+def find_test_module(
+    module_name: str | None, notebook: pathlib.Path, tests_dir: pathlib.Path
+) -> pathlib.Path | None:
+    """
+    The test module of a cell: the one named on the `%%ipytest` line, or the one of the notebook.
+    A renamed notebook, e.g., `jdoe_03_functions.ipynb`, matches the longest module name it contains.
+    """
+    if module_name is not None:
+        module_file = tests_dir / f"test_{module_name}.py"
+        return module_file if module_file.exists() else None
+
+    module_file = tests_dir / f"test_{notebook.stem}.py"
+    if module_file.exists():
+        return module_file
+
+    candidates = [
+        path
+        for path in tests_dir.glob("test_*.py")
+        if path.stem.removeprefix("test_") in notebook.stem
+    ]
+    return max(candidates, key=lambda path: len(path.stem), default=None)
+
+
+def _row(
+    submission: Submission,
+    root: pathlib.Path,
+    module: str | None,
+    function: str | None,
+    status: str,
+    passed: int = 0,
+    failed: int = 0,
+    duration: float = 0.0,
+) -> dict[str, Any]:
+    return {
+        "submission": str(submission.path.relative_to(root)),
+        "sha256": submission.sha256,
+        "module": module,
+        "function": function,
+        "status": status,
+        "passed": passed,
+        "failed": failed,
+        "total": passed + failed,
+        "duration": round(duration, 6),
+    }
+
+
+def _grade_in_process(
+    conn: Connection,
+    submission: Submission,
+    root: pathlib.Path,
+    tests_dir: pathlib.Path,
+    options: RunOptions,
+) -> None:
+    """Entry point of a grading process: send one row per solution function"""
+    from .testsuite import run_pytest_for_function
+
+    # A solution waiting for input would only wait for the timeout
+    sys.stdin = open(os.devnull)
+
+    try:
+        notebook = json.loads(submission.path.read_text(encoding="utf-8"))
+        imports, cells = extract_cells(notebook)
+    except (OSError, ValueError) as err:
+        conn.send(_row(submission, root, None, None, type(err).__name__))
+        return
+
+    namespace: dict[str, Any] = {"__name__": "__main__"}
+    for statement in imports:
+        try:
+            exec(compile(statement, "<imports>", "exec"), namespace)
+        except Exception:
+            # The solutions that need a missing module fail on their own
+            pass
+
+    for cell in cells:
+        module_file = find_test_module(cell.module_name, submission.path, tests_dir)
+        module = (
+            module_file.stem.removeprefix("test_") if module_file else cell.module_name
+        )
+
+        # The cells share a namespace, as they would in the notebook
+        try:
+            exec(compile(cell.source_code, str(submission.path), "exec"), namespace)
+        except BaseException:
+            for name in cell.functions:
+                conn.send(
+                    _row(
+                        submission,
+                        root,
+                        module,
+                        name,
+                        IPytestOutcome.COMPILE_ERROR.name,
+                    )
+                )
+            continue
+
+        for name in cell.functions:
+            if module_file is None:
+                conn.send(
+                    _row(
+                        submission,
+                        root,
+                        module,
+                        name,
+                        IPytestOutcome.NO_TEST_FOUND.name,
+                    )
+                )
+                continue
+
+            result = run_pytest_for_function(
+                module_file,
+                AFunction(
+                    name=name,
+                    implementation=namespace[f"solution_{name}"],
+                    source_code=cell.source_code,
+                ),
+                options=options,
+            )
+            tests = result.test_results or []
+            passed = sum(test.outcome == TestOutcome.PASS for test in tests)
+            conn.send(
+                _row(
+                    submission,
+                    root,
+                    module,
+                    name,
+                    result.status.name if result.status else "UNKNOWN_ERROR",
+                    passed=passed,
+                    failed=len(tests) - passed,
+                    duration=sum(test.duration or 0.0 for test in tests),
+                )
+            )
+
+
+def grade_submission(
+    context: multiprocessing.context.BaseContext,
+    submission: Submission,
+    root: pathlib.Path,
+    tests_dir: pathlib.Path,
+    options: RunOptions,
+    timeout: float | None,
+) -> list[dict[str, Any]]:
+    """Grade a submission in a new process, killed after `timeout` seconds"""
+    conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(  # type: ignore[attr-defined]
+        target=_grade_in_process,
+        args=(child_conn, submission, root, tests_dir, options),
+        daemon=True,
+    )
+    process.start()
+    child_conn.close()
+
+    rows = []
+    deadline = time.monotonic() + timeout if timeout else None
+    status = None
+    try:
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and (remaining <= 0 or not conn.poll(remaining)):
+                status = IPytestOutcome.TIMEOUT.name
+                break
+            rows.append(conn.recv())
+    except EOFError:
+        # The process finished, or died, e.g., it ran out of memory
+        pass
+    finally:
+        if status is None:
+            process.join(EXIT_GRACE_PERIOD)
+        # Only a process that is still running is killed here: any other
+        # SIGKILL came from outside, e.g., from the out-of-memory killer
+        killed = process.is_alive()
+        process.kill()
+        process.join()
+        conn.close()
+
+    if status is None and not killed and process.exitcode != 0:
+        status = (
+            IPytestOutcome.RESOURCE_LIMIT.name
+            if process.exitcode == KILLED_EXITCODE
+            else IPytestOutcome.PYTEST_ERROR.name
+        )
+    if status is not None or not rows:
+        # Record the submission, so that a resumed run does not grade it again
+        rows.append(_row(submission, root, None, None, status or "NO_SOLUTIONS"))
+
+    return rows
+
+
+def read_state(path: pathlib.Path) -> dict[str, list[dict[str, Any]]]:
+    """The rows already graded, by submission"""
+    rows: dict[str, list[dict[str, Any]]] = {}
+    if not path.exists():
+        return rows
+
+    with path.open(encoding="utf-8") as file:
+        for line in file:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line of an interrupted run
+                continue
+            graded = rows.setdefault(row["submission"], [])
+            # A submission that changed since was graded again: keep the latest rows
+            if graded and graded[0]["sha256"] != row["sha256"]:
+                graded.clear()
+            graded.append(row)
+
+    return rows
+
+
+def write_gradebook(path: pathlib.Path, rows: list[dict[str, Any]]) -> None:
+    """Write the rows as JSON if the file name ends with `.json`, as CSV otherwise"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".json":
+        path.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        return
+
+    with path.open("w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=GRADEBOOK_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def grade(
+    root: pathlib.Path,
+    output: pathlib.Path,
+    tests_dir: pathlib.Path,
+    workers: int,
+    options: RunOptions,
+    timeout: float | None,
+    state: pathlib.Path | None = None,
+) -> list[dict[str, Any]]:
+    """Grade the notebooks of `root` that are not graded yet, and write the gradebook"""
+    state = state or output.with_name(f"{output.name}.state.jsonl")
+    graded = read_state(state)
+
+    submissions = []
+    for path in sorted(root.rglob("*.ipynb")):
+        if ".ipynb_checkpoints" in path.parts:
+            continue
+        submission = Submission.from_path(path)
+        rows = graded.get(str(path.relative_to(root)))
+        if not rows or rows[0]["sha256"] != submission.sha256:
+            submissions.append(submission)
+
+    # Every grading process starts with pytest and the test suite already imported
+    context = process_context([f"{__package__}.testsuite"])
+
+    lock = threading.Lock()
+    state.parent.mkdir(parents=True, exist_ok=True)
+    with (
+        ThreadPoolExecutor(max_workers=workers) as executor,
+        state.open("a", encoding="utf-8") as file,
+    ):
+        futures = {
+            executor.submit(
+                grade_submission, context, submission, root, tests_dir, options, timeout
+            ): submission
+            for submission in submissions
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            rows = future.result()
+            with lock:
+                file.writelines(json.dumps(row) + "\n" for row in rows)
+                file.flush()
+            graded[rows[0]["submission"]] = rows
+            print(
+                f"[{i}/{len(submissions)}] {futures[future].path}",
+                file=sys.stderr,
+            )
+
+    gradebook = [row for name in sorted(graded) for row in graded[name]]
+    write_gradebook(output, gradebook)
+    return gradebook
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The arguments of the `grade` command"""
+    parser.add_argument(
+        "submissions", type=pathlib.Path, help="directory of the submitted notebooks"
+    )
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=pathlib.Path("gradebook.csv"),
+        help="gradebook file, written as JSON if its name ends with .json",
+    )
+    parser.add_argument(
+        "--tests",
+        type=pathlib.Path,
+        default=pathlib.Path("tutorial/tests"),
+        help="directory of the test modules",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of submissions graded at the same time",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="time limit of each test, in seconds, instead of its `timeout` marker"
+        f" or the default of {DEFAULT_TIMEOUT:g}",
+    )
+    parser.add_argument(
+        "--submission-timeout",
+        type=float,
+        default=DEFAULT_SUBMISSION_TIMEOUT,
+        help="time limit of each submission, in seconds",
+    )
+
+
+def main(args: argparse.Namespace) -> int:
+    """Grade the submissions and print a summary"""
+    gradebook = grade(
+        args.submissions.resolve(),
+        args.output,
+        args.tests.resolve(),
+        workers=max(1, args.workers),
+        options=RunOptions(
+            limits=ResourceLimits.from_env().with_options(
+                {"timeout": str(args.timeout)} if args.timeout is not None else {}
+            )
+        ),
+        timeout=args.submission_timeout or None,
+    )
+
+    passed = sum(row["passed"] for row in gradebook)
+    total = sum(row["total"] for row in gradebook)
+    submissions = len({row["submission"] for row in gradebook})
+    print(f"{submissions} submissions, {passed}/{total} tests passed: {args.output}")
+    return 0
@@ -1,7 +1,13 @@
+import cProfile
+import functools
 import html
+import pstats
 import re
+import threading
+import traceback
+import tracemalloc
 from collections.abc import Callable
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from enum import Enum
 from pathlib import Path
 from types import TracebackType
@@ -13,7 +19,14 @@ from IPython.display import Code
 from IPython.display import display as ipython_display
 from ipywidgets import HTML
 
-from .ai_helpers import AIExplanation, OpenAIWrapper
+from .ai_helpers import AI_EXPLANATION_STYLES, AIExplanation, OpenAIWrapper
+from .capture import CapturedOutput, max_output_bytes
+from .exceptions import ResourceLimitError, TestTimeoutError
+from .limits import ResourceLimits
+from .styles import stylesheets
+
+# Hard limit on the size of a formatted traceback, in bytes
+MAX_TRACEBACK_BYTES = 64 * 1024
 
 
 def strip_ansi_codes(text: str) -> str:
@@ -22,10 +35,89 @@ def strip_ansi_codes(text: str) -> str:
     return ansi_escape.sub("", text)
 
 
+def truncate_text(text: str, max_bytes: int) -> str:
+    """Keep the head and the tail of a text that does not fit in `max_bytes`"""
+    data = text.encode("utf-8")
+    if len(data) <= max_bytes:
+        return text
+
+    half = max_bytes // 2
+    return (
+        f"{data[:half].decode('utf-8', 'ignore')}"
+        f"\n\n... {len(data) - 2 * half} bytes truncated ...\n\n"
+        f"{data[-half:].decode('utf-8', 'ignore')}"
+    )
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration with a unit suited to its magnitude"""
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+def format_size(size: int) -> str:
+    """Format a number of bytes with a binary unit"""
+    value = float(size)
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GiB"
+
+
+def format_exception(
+    exception: BaseException,
+    tb: TracebackType | None = None,
+    test_path: Path | None = None,
+) -> str:
+    """
+    Format an exception like pytest does, with the arguments and locals of each frame.
+    Each local is truncated by pytest's `saferepr`, and the whole text to `MAX_TRACEBACK_BYTES`.
+
+    With `test_path`, the traceback is pruned like pytest prunes its own: it starts at
+    the test module, skipping the frames of pytest and pluggy, and only the frames of
+    the test module show their locals.
+    """
+    if tb is None:
+        # The frames are gone, e.g., the result was cached or sent by a worker
+        return "".join(traceback.format_exception_only(exception))
+
+    excinfo = pytest.ExceptionInfo.from_exc_info((type(exception), exception, tb))
+    formatted = excinfo.getrepr(
+        showlocals=True,
+        style="long",
+        funcargs=True,
+        abspath=False,
+        tbfilter=(
+            (lambda info: info.traceback.cut(path=test_path).filter(info))
+            if test_path is not None
+            else True
+        ),
+        chain=True,
+        truncate_locals=True,
+        truncate_args=True,
+    )
+
+    if test_path is not None:
+        for reprtraceback, *_ in getattr(formatted, "chain", []):
+            for entry in reprtraceback.reprentries:
+                location = getattr(entry, "reprfileloc", None)
+                if location is not None and Path(location.path).resolve() != test_path:
+                    entry.reprlocals = None
+
+    return truncate_text(strip_ansi_codes(str(formatted)), MAX_TRACEBACK_BYTES)
+
+
 class TestOutcome(Enum):
     PASS = 1
     FAIL = 2
     TEST_ERROR = 3
+    TIMEOUT = 4
+    RESOURCE_LIMIT = 5
+    NOT_RUN = 6
 
 
 class IPytestOutcome(Enum):
@@ -35,6 +127,250 @@ class IPytestOutcome(Enum):
     NO_TEST_FOUND = 3
     PYTEST_ERROR = 4
     UNKNOWN_ERROR = 5
+    TIMEOUT = 6
+    RESOURCE_LIMIT = 7
+
+
+# The outcomes of a run that count as an attempt to solve the exercise
+ATTEMPT_STATUSES = frozenset(
+    {IPytestOutcome.FINISHED, IPytestOutcome.TIMEOUT, IPytestOutcome.RESOURCE_LIMIT}
+)
+
+
+DEBUG_STYLES = stylesheets.register(
+    "debug",
+    """
+    .debug-container {
+        font-family: ui-monospace, monospace;
+        background: #f8f9fa;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        margin: 1rem 0;
+    }
+    .debug-title {
+        font-size: 1.2rem;
+        font-weight: 600;
+        margin-bottom: 1rem;
+    }
+    .debug-section {
+        margin: 0.5rem 0;
+    }
+    .debug-result {
+        margin: 1rem 0;
+        padding: 0.5rem;
+        border: 1px solid #e5e7eb;
+        border-radius: 0.375rem;
+    }
+    .debug-list {
+        margin-left: 1rem;
+    }
+""",
+)
+
+TEST_RESULT_STYLES = stylesheets.register(
+    "test-result",
+    """
+    .test-result {
+        font-family: system-ui, -apple-system, sans-serif;
+        margin: 0.75rem 0;
+        padding: 1rem;
+        border-radius: 0.5rem;
+        transition: all 0.2s ease;
+    }
+    .test-header {
+        display: flex;
+        align-items: center;
+        gap: 0.75rem;
+        margin-bottom: 0.75rem;
+    }
+    .test-icon {
+        font-size: 1.25rem;
+        width: 1.5rem;
+        height: 1.5rem;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+    }
+    .test-name {
+        font-family: ui-monospace, monospace;
+        font-size: 0.9rem;
+        padding: 0.25rem 0.5rem;
+        background: rgba(0, 0, 0, 0.05);
+        border-radius: 0.25rem;
+    }
+    .test-status {
+        font-weight: 600;
+        font-size: 1rem;
+    }
+    .test-metrics {
+        margin-left: auto;
+        font-size: 0.85rem;
+        color: #6b7280;
+    }
+    .test-pass {
+        background-color: #f0fdf4;
+        border: 1px solid #86efac;
+    }
+    .test-fail {
+        background-color: #fef2f2;
+        border: 1px solid #fecaca;
+    }
+    .test-error {
+        background-color: #fff7ed;
+        border: 1px solid #fed7aa;
+    }
+    .error-block {
+        background-color: #ffffff;
+        border: 1px solid rgba(0, 0, 0, 0.1);
+        padding: 1rem;
+        border-radius: 0.375rem;
+        margin-top: 0.75rem;
+    }
+    .error-title {
+        font-weight: 600;
+        color: #dc2626;
+        margin-bottom: 0.5rem;
+    }
+    .error-message {
+        font-family: ui-monospace, monospace;
+        font-size: 0.9rem;
+        white-space: pre-wrap;
+        margin: 0;
+    }
+    .output-section {
+        margin-top: 0.75rem;
+    }
+    .output-tabs {
+        display: flex;
+        gap: 0.5rem;
+        border-bottom: 1px solid #e5e7eb;
+        margin-bottom: 0.5rem;
+    }
+    .output-tab {
+        border: none;
+        background: transparent;
+        padding: 0.5rem 1rem;
+        font-size: 0.9rem;
+        cursor: pointer;
+        border-bottom: 2px solid transparent;
+        color: #6b7280;
+    }
+    .output-tab.active {
+        border-bottom-color: #3b82f6;
+        color: #1f2937;
+        font-weight: 500;
+    }
+    .output-content {
+        padding: 1rem;
+        background: #ffffff;
+        border: 1px solid rgba(0, 0, 0, 0.1);
+        border-radius: 0.375rem;
+    }
+    .output-pane {
+        display: none;
+    }
+    .output-pane.active {
+        display: block;
+    }
+    .summary-table {
+        border-collapse: collapse;
+        margin-bottom: 1rem;
+        font-size: 0.95rem;
+    }
+    .summary-table th,
+    .summary-table td {
+        padding: 0.375rem 0.75rem;
+        border-bottom: 1px solid #e5e7eb;
+        text-align: left;
+    }
+    .summary-pass {
+        color: #059669;
+    }
+    .summary-fail {
+        color: #dc2626;
+    }
+""",
+)
+
+SOLUTION_STYLES = stylesheets.register(
+    "solution",
+    """
+    .solution-container {
+        margin-top: 1.5rem;
+        font-family: system-ui, -apple-system, sans-serif;
+    }
+    .solution-header {
+        display: flex;
+        align-items: center;
+        gap: 0.5rem;
+        margin-bottom: 1rem;
+        font-size: 1.1rem;
+        font-weight: 500;
+    }
+    .solution-box {
+        border: 1px solid #e5e7eb;
+        border-radius: 0.5rem;
+        overflow: hidden;
+        background: #ffffff;
+        padding: 0;  /* Remove padding from container */
+    }
+    .solution-code {
+        position: relative;
+    }
+    .solution-code pre {
+        margin: 0;
+        font-family: ui-monospace, monospace;
+        line-height: 1.5;
+    }
+    /* Style adjustments for the IPython Code class output */
+    .solution-code .highlight {
+        margin: 0;
+        padding: 1rem;  /* Add padding to the actual code content */
+    }
+    .solution-overlay {
+        position: absolute;
+        top: 0;
+        left: 0;
+        right: 0;
+        bottom: 0;
+        background: repeating-linear-gradient(
+            45deg,
+            rgba(30, 35, 40, 0.98),    /* Darker base color with higher opacity */
+            rgba(30, 35, 40, 0.98) 10px,
+            rgba(45, 50, 55, 0.98) 10px,  /* Slightly lighter but still dark */
+            rgba(45, 50, 55, 0.98) 20px
+        );
+        transition: opacity 0.3s ease;
+        opacity: 1;
+    }
+    .solution-button {
+        position: absolute;
+        top: 50%;
+        left: 50%;
+        transform: translate(-50%, -50%);
+        padding: 0.75rem 1.5rem;
+        background: #4b88ff;  /* Slightly softer blue */
+        color: white;
+        border: none;
+        border-radius: 0.5rem;
+        font-weight: 500;
+        cursor: pointer;
+        transition: all 0.2s ease;
+        z-index: 10;
+        font-size: 0.95rem;
+        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
+    }
+    .solution-button:hover {
+        background: #3b7bff;
+        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.15);
+        transform: translate(-50%, -52%);
+    }
+    .solution-button:disabled {
+        background: #94a3b8;
+        cursor: not-allowed;
+    }
+""",
+)
 
 
 @dataclass
@@ -48,35 +384,8 @@ class DebugOutput:
     def to_html(self) -> str:
         """Format debug information as HTML"""
         debug_parts = [
-            """
-            <style>
-                .debug-container {
-                    font-family: ui-monospace, monospace;
-                    background: #f8f9fa;
-                    padding: 1rem;
-                    border-radius: 0.5rem;
-                    margin: 1rem 0;
-                }
-                .debug-title {
-                    font-size: 1.2rem;
-                    font-weight: 600;
-                    margin-bottom: 1rem;
-                }
-                .debug-section {
-                    margin: 0.5rem 0;
-                }
-                .debug-result {
-                    margin: 1rem 0;
-                    padding: 0.5rem;
-                    border: 1px solid #e5e7eb;
-                    border-radius: 0.375rem;
-                }
-                .debug-list {
-                    margin-left: 1rem;
-                }
-            </style>
-            <div class="debug-container">
-        """
+            stylesheets.html(DEBUG_STYLES),
+            '<div class="debug-container">',
         ]
 
         # Overall test run info
@@ -96,7 +405,8 @@ class DebugOutput:
                 f"<strong>Result #{i}</strong><br>"
                 f"Status: {result.status.name if result.status else 'None'}<br>"
                 f"Function: {result.function.name if result.function else 'None'}<br>"
-                f"Solution attempts: {result.test_attempts}"
+                f"Solution attempts: {result.test_attempts}<br>"
+                f"Cached: {result.cached}"
             )
 
             if result.test_results:
@@ -108,6 +418,7 @@ class DebugOutput:
                 for test in result.test_results:
                     debug_parts.append(
                         f"• {test.test_name}: {test.outcome.name}"
+                        f"{f' ({test.metrics()})' if test.metrics() else ''}"
                         f"{f' - {type(test.exception).__name__}: {str(test.exception)}' if test.exception else ''}<br>"
                     )
                 debug_parts.append("</div></div>")
@@ -129,6 +440,18 @@ class DebugOutput:
         return "\n".join(debug_parts)
 
 
+@dataclass(frozen=True)
+class Hotspot:
+    """A function where the solution spent time, from the profiler's statistics"""
+
+    function: str
+    calls: int
+    # Time spent in the function itself, in seconds
+    total_time: float
+    # Time spent in the function and the ones it called, in seconds
+    cumulative_time: float
+
+
 @dataclass
 class TestCaseResult:
     """Container class to store the test results when we collect them"""
@@ -137,10 +460,18 @@ class TestCaseResult:
     outcome: TestOutcome
     exception: BaseException | None = None
     traceback: TracebackType | None = None
+    # The module of the test, where its traceback is pruned to start
+    test_path: Path | None = None
     formatted_exception: str = ""
-    stdout: str = ""
-    stderr: str = ""
+    stdout: CapturedOutput = field(default_factory=CapturedOutput)
+    stderr: CapturedOutput = field(default_factory=CapturedOutput)
     report_output: str = ""
+    # Duration of the test call, in seconds
+    duration: float | None = None
+    # Peak memory allocated by the solution function, in bytes, if traced
+    memory_peak: int | None = None
+    # The functions where the solution spent the most time, if profiled
+    hotspots: list["Hotspot"] | None = None
 
     def __str__(self) -> str:
         """Basic string representation"""
@@ -152,117 +483,36 @@ class TestCaseResult:
             f" - {str(self.exception) if self.exception else ''}\n"
             f"  formatted_exception: {self.formatted_exception[:100]}..."
             f" ({len(self.formatted_exception)} chars)\n"
-            f"  stdout: {len(self.stdout)} chars\n"
-            f"  stderr: {len(self.stderr)} chars\n"
+            f"  stdout: {self.stdout.size} bytes\n"
+            f"  stderr: {self.stderr.size} bytes\n"
             f"  report_output: {len(self.report_output)} chars\n"
+            f"  metrics: {self.metrics() or 'None'}\n"
             ")"
         )
 
-    def to_html(self) -> str:
-        """HTML representation of the test result"""
-        # CSS styles for the output
-        styles = """
-        <style>
-            .test-result {
-                font-family: system-ui, -apple-system, sans-serif;
-                margin: 0.75rem 0;
-                padding: 1rem;
-                border-radius: 0.5rem;
-                transition: all 0.2s ease;
-            }
-            .test-header {
-                display: flex;
-                align-items: center;
-                gap: 0.75rem;
-                margin-bottom: 0.75rem;
-            }
-            .test-icon {
-                font-size: 1.25rem;
-                width: 1.5rem;
-                height: 1.5rem;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-            }
-            .test-name {
-                font-family: ui-monospace, monospace;
-                font-size: 0.9rem;
-                padding: 0.25rem 0.5rem;
-                background: rgba(0, 0, 0, 0.05);
-                border-radius: 0.25rem;
-            }
-            .test-status {
-                font-weight: 600;
-                font-size: 1rem;
-            }
-            .test-pass {
-                background-color: #f0fdf4;
-                border: 1px solid #86efac;
-            }
-            .test-fail {
-                background-color: #fef2f2;
-                border: 1px solid #fecaca;
-            }
-            .test-error {
-                background-color: #fff7ed;
-                border: 1px solid #fed7aa;
-            }
-            .error-block {
-                background-color: #ffffff;
-                border: 1px solid rgba(0, 0, 0, 0.1);
-                padding: 1rem;
-                border-radius: 0.375rem;
-                margin-top: 0.75rem;
-            }
-            .error-title {
-                font-weight: 600;
-                color: #dc2626;
-                margin-bottom: 0.5rem;
-            }
-            .error-message {
-                font-family: ui-monospace, monospace;
-                font-size: 0.9rem;
-                white-space: pre-wrap;
-                margin: 0;
-            }
-            .output-section {
-                margin-top: 0.75rem;
-            }
-            .output-tabs {
-                display: flex;
-                gap: 0.5rem;
-                border-bottom: 1px solid #e5e7eb;
-                margin-bottom: 0.5rem;
-            }
-            .output-tab {
-                border: none;
-                background: transparent;
-                padding: 0.5rem 1rem;
-                font-size: 0.9rem;
-                cursor: pointer;
-                border-bottom: 2px solid transparent;
-                color: #6b7280;
-            }
-            .output-tab.active {
-                border-bottom-color: #3b82f6;
-                color: #1f2937;
-                font-weight: 500;
-            }
-            .output-content {
-                padding: 1rem;
-                background: #ffffff;
-                border: 1px solid rgba(0, 0, 0, 0.1);
-                border-radius: 0.375rem;
-            }
-            .output-pane {
-                display: none;
-            }
-            .output-pane.active {
-                display: block;
-            }
-        </style>
-        """
+    def metrics(self) -> str:
+        """The duration and the peak memory of the test, if known"""
+        metrics = []
+        if self.duration is not None:
+            metrics.append(format_duration(self.duration))
+        if self.memory_peak is not None:
+            metrics.append(f"{format_size(self.memory_peak)} peak")
+        return " · ".join(metrics)
+
+    def spilled_outputs(self) -> list[CapturedOutput]:
+        """The outputs of the test that were saved to a file because they were too large"""
+        return [output for output in (self.stdout, self.stderr) if output.spill_file]
+
+    def format_exception(self) -> str:
+        """The formatted traceback of the exception, computed the first time it is needed"""
+        if not self.formatted_exception and self.exception is not None:
+            self.formatted_exception = format_exception(
+                self.exception, self.traceback, self.test_path
+            )
+        return self.formatted_exception
 
+    def to_html(self) -> str:
+        """HTML representation of the test result, styled by `TEST_RESULT_STYLES`"""
         # Determine test status and icon
         match self.outcome:
             case TestOutcome.PASS:
@@ -277,6 +527,18 @@ class TestCaseResult:
                 status_class = "test-error"
                 icon = "🚨"
                 status_text = "Syntax Error"
+            case TestOutcome.TIMEOUT:
+                status_class = "test-error"
+                icon = "⏱️"
+                status_text = "Timed Out"
+            case TestOutcome.RESOURCE_LIMIT:
+                status_class = "test-error"
+                icon = "🧱"
+                status_text = "Resource Limit Exceeded"
+            case TestOutcome.NOT_RUN:
+                status_class = "test-error"
+                icon = "⏭️"
+                status_text = "Not Run"
             case _:
                 status_class = "test-error"
                 icon = "⚠️"
@@ -284,7 +546,7 @@ class TestCaseResult:
 
         # Start building the HTML content
         test_name = self.test_name.split("::")[-1]
-        html_parts = [styles]
+        html_parts = []
 
         # Main container
         html_parts.append(
@@ -294,6 +556,7 @@ class TestCaseResult:
                 <span class="test-icon">{icon}</span>
                 {f'<span class="test-name">{html.escape(test_name)}</span>' if test_name else ""}
                 <span class="test-status">{html.escape(status_text)}</span>
+                {f'<span class="test-metrics">{self.metrics()}</span>' if self.metrics() else ""}
             </div>
         """
         )
@@ -312,6 +575,25 @@ class TestCaseResult:
             """
             )
 
+        # Profile of the solution (if any)
+        if self.hotspots:
+            rows = "".join(
+                "<tr>"
+                f"<td><code>{html.escape(hotspot.function)}</code></td>"
+                f"<td>{hotspot.calls}</td>"
+                f"<td>{format_duration(hotspot.total_time)}</td>"
+                f"<td>{format_duration(hotspot.cumulative_time)}</td>"
+                "</tr>"
+                for hotspot in self.hotspots
+            )
+            html_parts.append(
+                '<details class="output-section"><summary>Profile</summary>'
+                '<table class="summary-table">'
+                "<tr><th>Function</th><th>Calls</th>"
+                "<th>Own time</th><th>Cumulative time</th></tr>"
+                f"{rows}</table></details>"
+            )
+
         # Output sections (if any)
         if self.stdout or self.stderr:
             # Generate unique IDs for this test's tabs
@@ -337,10 +619,10 @@ class TestCaseResult:
                             </div>
                             <div class="output-content">
                                 <div id="{tab_id}_output" class="output-pane active">
-                                    <pre>{html.escape(strip_ansi_codes(self.stdout)) if self.stdout else "No output"}</pre>
+                                    <pre>{html.escape(strip_ansi_codes(str(self.stdout))) if self.stdout else "No output"}</pre>
                                 </div>
                                 <div id="{tab_id}_error" class="output-pane">
-                                    <pre>{html.escape(strip_ansi_codes(self.stderr)) if self.stderr else "No errors"}</pre>
+                                    <pre>{html.escape(strip_ansi_codes(str(self.stderr))) if self.stderr else "No errors"}</pre>
                                 </div>
                             </div>
                         </div>
@@ -362,6 +644,21 @@ class AFunction:
     source_code: str | None
 
 
+@dataclass(frozen=True)
+class RunOptions:
+    """Options of a test run, set with the line options of `%%ipytest`"""
+
+    limits: ResourceLimits = field(default_factory=ResourceLimits)
+    # Stop after the first failing test
+    failfast: bool = False
+    # Names of the tests to run before the others
+    failed_first: frozenset[str] = frozenset()
+    # Measure the peak memory allocated by the solution function
+    trace_memory: bool = False
+    # Profile the solution function
+    profile: bool = False
+
+
 @dataclass
 class IPytestResult:
     """Class to store the results of running pytest on a solution function"""
@@ -372,6 +669,24 @@ class IPytestResult:
     exceptions: list[BaseException] | None = None
     test_attempts: int = 0
     cell_content: str | None = None
+    cached: bool = False
+
+    def spilled_outputs(self) -> list[CapturedOutput]:
+        """The outputs of the tests that were saved to a file because they were too large"""
+        return [
+            output
+            for test in self.test_results or []
+            for output in test.spilled_outputs()
+        ]
+
+
+RESULTS_BOX_LAYOUT = {
+    "border": "1px solid #e5e7eb",
+    "background-color": "#ffffff",
+    "margin": "5px",
+    "padding": "0.75rem",
+    "border-radius": "0.5rem",
+}
 
 
 @dataclass
@@ -379,20 +694,39 @@ class TestResultOutput:
     """Class to prepare and display test results in a Jupyter notebook"""
 
     ipytest_result: IPytestResult
-    solution: str | None = None
+    # The solution code, or a function to compute it when the student asks for it
+    solution: str | Callable[[], str] | None = None
     MAX_ATTEMPTS: ClassVar[int] = 3
+    # Above this many test cases, show a summary table instead of every case
+    SUMMARY_THRESHOLD: ClassVar[int] = 10
     openai_client: OpenAIWrapper | None = None
 
     def display_results(self) -> None:
         """Display the test results in an output widget as a VBox"""
+        ipython_display(self.to_widget())
+
+    def to_widget(self) -> ipywidgets.VBox:
+        """Prepare the test results and the solution in a VBox"""
+        cells = self.prepare_cells()
+
+        # The stylesheet of the results, unless this cell's output already has it
+        if styles := stylesheets.html(TEST_RESULT_STYLES):
+            cells.insert(0, HTML(styles))
+
+        return ipywidgets.VBox(
+            children=cells,
+            layout=RESULTS_BOX_LAYOUT,
+        )
+
+    def prepare_cells(self) -> list[ipywidgets.Widget]:
+        """Prepare the widgets of the test results and the solution"""
         cells = []
 
         output_cell = self.prepare_output_cell()
-        solution_cell = self.prepare_solution_cell()
 
         cells.append(output_cell)
 
-        tests_finished = self.ipytest_result.status == IPytestOutcome.FINISHED
+        tests_finished = self.ipytest_result.status in ATTEMPT_STATUSES
         success = (
             all(
                 test.outcome == TestOutcome.PASS
@@ -403,7 +737,7 @@ class TestResultOutput:
         )
 
         if success or self.ipytest_result.test_attempts >= self.MAX_ATTEMPTS:
-            cells.append(solution_cell)
+            cells.append(self.prepare_solution_cell())
         else:
             if tests_finished:
                 attempts_remaining = (
@@ -421,18 +755,7 @@ class TestResultOutput:
                     )
                 )
 
-        ipython_display(
-            ipywidgets.VBox(
-                children=cells,
-                layout={
-                    "border": "1px solid #e5e7eb",
-                    "background-color": "#ffffff",
-                    "margin": "5px",
-                    "padding": "0.75rem",
-                    "border-radius": "0.5rem",
-                },
-            )
-        )
+        return cells
 
     # TODO: This is left for reference if we ever want to bring back this styling
     # Perhaps we should remove it if it's unnecessary
@@ -441,85 +764,6 @@ class TestResultOutput:
         # Generate a unique ID for each solution cell
         uuid = f"solution_{id(self)}"
 
-        styles = """
-        <style>
-            .solution-container {
-                margin-top: 1.5rem;
-                font-family: system-ui, -apple-system, sans-serif;
-            }
-            .solution-header {
-                display: flex;
-                align-items: center;
-                gap: 0.5rem;
-                margin-bottom: 1rem;
-                font-size: 1.1rem;
-                font-weight: 500;
-            }
-            .solution-box {
-                border: 1px solid #e5e7eb;
-                border-radius: 0.5rem;
-                overflow: hidden;
-                background: #ffffff;
-                padding: 0;  /* Remove padding from container */
-            }
-            .solution-code {
-                position: relative;
-            }
-            .solution-code pre {
-                margin: 0;
-                font-family: ui-monospace, monospace;
-                line-height: 1.5;
-            }
-            /* Style adjustments for the IPython Code class output */
-            .solution-code .highlight {
-                margin: 0;
-                padding: 1rem;  /* Add padding to the actual code content */
-            }
-            .solution-overlay {
-                position: absolute;
-                top: 0;
-                left: 0;
-                right: 0;
-                bottom: 0;
-                background: repeating-linear-gradient(
-                    45deg,
-                    rgba(30, 35, 40, 0.98),    /* Darker base color with higher opacity */
-                    rgba(30, 35, 40, 0.98) 10px,
-                    rgba(45, 50, 55, 0.98) 10px,  /* Slightly lighter but still dark */
-                    rgba(45, 50, 55, 0.98) 20px
-                );
-                transition: opacity 0.3s ease;
-                opacity: 1;
-            }
-            .solution-button {
-                position: absolute;
-                top: 50%;
-                left: 50%;
-                transform: translate(-50%, -50%);
-                padding: 0.75rem 1.5rem;
-                background: #4b88ff;  /* Slightly softer blue */
-                color: white;
-                border: none;
-                border-radius: 0.5rem;
-                font-weight: 500;
-                cursor: pointer;
-                transition: all 0.2s ease;
-                z-index: 10;
-                font-size: 0.95rem;
-                box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-            }
-            .solution-button:hover {
-                background: #3b7bff;
-                box-shadow: 0 4px 6px rgba(0, 0, 0, 0.15);
-                transform: translate(-50%, -52%);
-            }
-            .solution-button:disabled {
-                background: #94a3b8;
-                cursor: not-allowed;
-            }
-        </style>
-        """
-
         solution_cell = ipywidgets.Output()
 
         # Return an empty output widget if no solution is provided
@@ -530,7 +774,7 @@ class TestResultOutput:
         solution_cell.append_display_data(
             HTML(
                 f"""
-            {styles}
+            {stylesheets.html(SOLUTION_STYLES)}
             <div class="solution-container">
                 <div class="solution-header">
                     <span>👉</span>
@@ -539,7 +783,7 @@ class TestResultOutput:
                 <div class="solution-box">
                     <div class="solution-code">
                         <div id="{uuid}_content">
-                            {Code(data=self.solution, language="python")._repr_html_()}
+                            {Code(data=self.solution_code(), language="python")._repr_html_()}
                         </div>
                         <div class="solution-overlay" id="{uuid}_overlay">
                             <button class="solution-button" onclick="
@@ -559,30 +803,34 @@ class TestResultOutput:
 
         return solution_cell
 
+    def solution_code(self) -> str:
+        """Return the solution code, computing it if needed"""
+        if callable(self.solution):
+            try:
+                self.solution = self.solution()
+            except Exception:
+                self.solution = "# No solution available for this exercise"
+        return self.solution or ""
+
     def prepare_solution_cell(self) -> ipywidgets.Widget:
         """Prepare the cell to display the solution code with a collapsible accordion"""
         # Return an empty output widget if no solution is provided
         if self.solution is None:
             return ipywidgets.Output()
 
-        # Create the solution content
+        # The solution content is extracted and highlighted only when first expanded
         solution_output = ipywidgets.Output(
             layout=ipywidgets.Layout(padding="1rem", border="1px solid #e5e7eb")
         )
-        with solution_output:
-            ipython_display(Code(data=self.solution, language="python"))
 
         # Create header with emoji
-        header_output = ipywidgets.Output()
-        with header_output:
-            ipython_display(
-                HTML(
-                    '<div style="display: flex; align-items: center; gap: 0.5rem;">'
-                    '<span style="font-size: 1.1rem;">👉</span>'
-                    '<span style="font-size: 1.1rem; font-weight: 500;">Proposed solution</span>'
-                    "</div>"
-                )
-            )
+        # No display inside an `Output` context: it may run on a background thread
+        header = HTML(
+            '<div style="display: flex; align-items: center; gap: 0.5rem;">'
+            '<span style="font-size: 1.1rem;">👉</span>'
+            '<span style="font-size: 1.1rem; font-weight: 500;">Proposed solution</span>'
+            "</div>"
+        )
 
         # Create the collapsible accordion (closed by default)
         accordion = ipywidgets.Accordion(
@@ -596,14 +844,147 @@ class TestResultOutput:
             ),
         )
 
+        def render_solution(change: dict) -> None:
+            if change["new"] is None or solution_output.outputs:
+                return
+            solution_output.append_display_data(
+                Code(data=self.solution_code(), language="python")
+            )
+
+        accordion.observe(render_solution, names="selected_index")
+
         return ipywidgets.VBox(
-            children=[header_output, accordion],
+            children=[header, accordion],
             layout=ipywidgets.Layout(
                 margin="0",
                 padding="0",
             ),
         )
 
+    def prepare_test_cells(self, test: TestCaseResult) -> list[ipywidgets.Widget]:
+        """Prepare the result of a test, with its traceback and full output on demand"""
+        return [
+            HTML(test.to_html()),
+            *([self.prepare_traceback_cell(test)] if test.exception else []),
+            *([self.prepare_full_output_cell(test)] if test.spilled_outputs() else []),
+        ]
+
+    def prepare_full_output_cell(self, test: TestCaseResult) -> ipywidgets.Widget:
+        """Prepare a collapsible view of the outputs that were too large to show, read when expanded"""
+        pagers = {
+            title: OutputPager(output)
+            for title, output in (("Output", test.stdout), ("Error", test.stderr))
+            if output.spill_file
+        }
+
+        accordion = ipywidgets.Accordion(
+            children=[
+                ipywidgets.VBox(
+                    children=[
+                        widget
+                        for title, pager in pagers.items()
+                        for widget in (HTML(f"<strong>{title}</strong>"), pager.widget)
+                    ]
+                )
+            ],
+            selected_index=None,  # Start collapsed
+            titles=("Show full output",),
+            layout=ipywidgets.Layout(margin="0 0 0.75rem 0"),
+        )
+
+        def render_output(change: dict) -> None:
+            if change["new"] is None:
+                return
+            for pager in pagers.values():
+                if pager.page is None:
+                    pager.show(0)
+
+        accordion.observe(render_output, names="selected_index")
+
+        return accordion
+
+    def prepare_traceback_cell(self, test: TestCaseResult) -> ipywidgets.Widget:
+        """Prepare a collapsible traceback, formatted only when first expanded"""
+        traceback_output = ipywidgets.Output()
+
+        accordion = ipywidgets.Accordion(
+            children=[traceback_output],
+            selected_index=None,  # Start collapsed
+            titles=("Show traceback",),
+            layout=ipywidgets.Layout(margin="0 0 0.75rem 0"),
+        )
+
+        def render_traceback(change: dict) -> None:
+            if change["new"] is None or traceback_output.outputs:
+                return
+            traceback_output.append_display_data(
+                HTML(
+                    '<pre class="error-message">'
+                    f"{html.escape(test.format_exception())}</pre>"
+                )
+            )
+
+        accordion.observe(render_traceback, names="selected_index")
+
+        return accordion
+
+    def display_test_results(self, output_cell: ipywidgets.Output) -> None:
+        """Display the individual test results, or a summary if there are many"""
+        test_results = self.ipytest_result.test_results or []
+        if len(test_results) > self.SUMMARY_THRESHOLD:
+            output_cell.append_display_data(self.prepare_summary_cell())
+            return
+
+        for test in test_results:
+            for cell in self.prepare_test_cells(test):
+                output_cell.append_display_data(cell)
+
+    def prepare_summary_cell(self) -> ipywidgets.Widget:
+        """Prepare a table of the test results by test function, with the failures on demand"""
+        test_results = self.ipytest_result.test_results or []
+
+        # Test function -> (passed, failed)
+        counts: dict[str, list[int]] = {}
+        for test in test_results:
+            name = test.test_name.split("::")[-1].split("[")[0]
+            counts.setdefault(name, [0, 0])[test.outcome != TestOutcome.PASS] += 1
+
+        rows = "".join(
+            "<tr>"
+            f'<td><span class="test-name">{html.escape(name)}</span></td>'
+            f'<td class="summary-pass">✅ {passed}</td>'
+            f'<td class="summary-fail">❌ {failed}</td>'
+            "</tr>"
+            for name, (passed, failed) in counts.items()
+        )
+        table = HTML(
+            '<table class="summary-table">'
+            "<tr><th>Test</th><th>Passed</th><th>Failed</th></tr>"
+            f"{rows}</table>"
+        )
+
+        failed_tests = [
+            test for test in test_results if test.outcome != TestOutcome.PASS
+        ]
+        if not failed_tests:
+            return table
+
+        # The failed cases are rendered only when expanded, one page at a time
+        pager = TestResultsPager(failed_tests, self.prepare_test_cells)
+        accordion = ipywidgets.Accordion(
+            children=[pager.widget],
+            selected_index=None,  # Start collapsed
+            titles=(f"Show failed tests ({len(failed_tests)})",),
+        )
+
+        def render_failures(change: dict) -> None:
+            if change["new"] is not None and pager.page is None:
+                pager.show(0)
+
+        accordion.observe(render_failures, names="selected_index")
+
+        return ipywidgets.VBox(children=[table, accordion])
+
     def prepare_output_cell(self) -> ipywidgets.Output:
         """Prepare the cell to display the test results"""
         output_cell = ipywidgets.Output()
@@ -622,6 +1003,15 @@ class TestResultOutput:
             )
         )
 
+        if self.ipytest_result.cached:
+            output_cell.append_display_data(
+                HTML(
+                    '<div style="margin: 0.5rem 0; font-size: 0.9rem; color: #6b7280;">'
+                    "♻️ The solution did not change: these are the results of the previous run."
+                    "</div>"
+                )
+            )
+
         match self.ipytest_result.status:
             case (
                 IPytestOutcome.COMPILE_ERROR
@@ -675,9 +1065,7 @@ class TestResultOutput:
                     )
                 )
 
-                # Display individual test results
-                for test in self.ipytest_result.test_results:
-                    output_cell.append_display_data(HTML(test.to_html()))
+                self.display_test_results(output_cell)
 
                 failed_tests = [
                     test
@@ -694,6 +1082,34 @@ class TestResultOutput:
 
                     output_cell.append_display_data(ai_explains.render())
 
+            case IPytestOutcome.TIMEOUT | IPytestOutcome.RESOURCE_LIMIT:
+                message = (
+                    "⏱️ Your solution took too long. Is there an infinite loop?"
+                    if self.ipytest_result.status == IPytestOutcome.TIMEOUT
+                    else "🧱 Your solution used more CPU time or memory than allowed."
+                )
+                output_cell.append_display_data(
+                    HTML(
+                        '<div style="margin-bottom: 1rem; font-size: 0.95rem; color: #c2410c;">'
+                        f"{message}</div>"
+                    )
+                )
+
+                # Display the tests that ran, or the error if the run was stopped
+                if self.ipytest_result.test_results:
+                    self.display_test_results(output_cell)
+                elif self.ipytest_result.exceptions:
+                    error_result = TestCaseResult(
+                        test_name=f"error::solution_{function.name}"
+                        if function
+                        else "::",
+                        outcome=TestOutcome.TIMEOUT
+                        if self.ipytest_result.status == IPytestOutcome.TIMEOUT
+                        else TestOutcome.RESOURCE_LIMIT,
+                        exception=self.ipytest_result.exceptions[0],
+                    )
+                    output_cell.append_display_data(HTML(error_result.to_html()))
+
             case IPytestOutcome.SOLUTION_FUNCTION_MISSING:
                 output_cell.append_display_data(
                     HTML(
@@ -710,6 +1126,160 @@ class TestResultOutput:
         return output_cell
 
 
+class TestResultsPager:
+    """Class to display a list of test results one page at a time"""
+
+    PAGE_SIZE: ClassVar[int] = 5
+
+    def __init__(
+        self,
+        tests: list[TestCaseResult],
+        render: Callable[[TestCaseResult], list[ipywidgets.Widget]],
+    ) -> None:
+        self.tests = tests
+        self.render = render
+        self.page: int | None = None
+
+        self._output = ipywidgets.Output()
+        self._label = HTML()
+        self._previous = ipywidgets.Button(icon="chevron-left", description="Previous")
+        self._next = ipywidgets.Button(icon="chevron-right", description="Next")
+        self._previous.on_click(lambda _: self.show((self.page or 0) - 1))
+        self._next.on_click(lambda _: self.show((self.page or 0) + 1))
+
+        self.widget = ipywidgets.VBox(
+            children=[
+                ipywidgets.HBox(children=[self._previous, self._label, self._next]),
+                self._output,
+            ]
+        )
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-len(self.tests) // self.PAGE_SIZE))
+
+    def show(self, page: int) -> None:
+        """Replace the displayed test results with the ones of another page"""
+        self.page = min(max(page, 0), self.pages - 1)
+        start = self.page * self.PAGE_SIZE
+
+        self._output.outputs = ()
+        for test in self.tests[start : start + self.PAGE_SIZE]:
+            for widget in self.render(test):
+                self._output.append_display_data(widget)
+
+        self._label.value = (
+            '<div style="padding: 0.25rem 0.75rem;">'
+            f"Page {self.page + 1} of {self.pages}</div>"
+        )
+        self._previous.disabled = self.page == 0
+        self._next.disabled = self.page == self.pages - 1
+
+
+class OutputPager:
+    """Class to display a saved output one page at a time, each within the output budget"""
+
+    def __init__(self, output: CapturedOutput) -> None:
+        self.output = output
+        self.page_bytes = max(1, max_output_bytes())
+        self.page: int | None = None
+
+        self._content = HTML()
+        self._label = HTML()
+        self._previous = ipywidgets.Button(icon="chevron-left", description="Previous")
+        self._next = ipywidgets.Button(icon="chevron-right", description="Next")
+        self._previous.on_click(lambda _: self.show((self.page or 0) - 1))
+        self._next.on_click(lambda _: self.show((self.page or 0) + 1))
+
+        self.widget = ipywidgets.VBox(
+            children=[
+                ipywidgets.HBox(children=[self._previous, self._label, self._next]),
+                self._content,
+            ]
+        )
+
+    @property
+    def pages(self) -> int:
+        # Without its file, only the part that was kept is left
+        if not self.output.saved:
+            return 1
+        return max(1, -(-self.output.size // self.page_bytes))
+
+    def show(self, page: int) -> None:
+        """Replace the displayed part of the output with another page"""
+        self.page = min(max(page, 0), self.pages - 1)
+
+        if self.output.saved:
+            start = self.page * self.page_bytes
+            text = self.output.read(start, self.page_bytes)
+            label = (
+                f"Bytes {start + 1}–{min(start + self.page_bytes, self.output.size)}"
+                f" of {self.output.size}"
+            )
+        else:
+            text, label = str(self.output), "The full output was deleted"
+
+        self._content.value = f"<pre>{html.escape(strip_ansi_codes(text))}</pre>"
+        self._label.value = f'<div style="padding: 0.25rem 0.75rem;">{label}</div>'
+        self._previous.disabled = self.page == 0
+        self._next.disabled = self.page == self.pages - 1
+
+
+class StreamingTestOutput:
+    """Class to display the test results of a function as soon as they arrive"""
+
+    def __init__(self, function: AFunction) -> None:
+        self.passed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+        # Created in the kernel thread, for the output of the cell being executed
+        self._styles = HTML(stylesheets.html(TEST_RESULT_STYLES, AI_EXPLANATION_STYLES))
+        self._counter = HTML()
+        self._results = ipywidgets.Output()
+        self._update_counter(running=True)
+
+        self.widget = ipywidgets.VBox(
+            children=[
+                self._styles,
+                HTML(
+                    '<h2 style="font-size: 1.5rem; margin: 0;">Test Results for '
+                    '<code style="font-size: 1.1rem; background: #f3f4f6; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-family: ui-monospace, monospace;">'
+                    f"solution_{html.escape(function.name)}</code></h2>"
+                ),
+                self._counter,
+                self._results,
+            ],
+            layout=RESULTS_BOX_LAYOUT,
+        )
+
+    def _update_counter(self, running: bool) -> None:
+        self._counter.value = (
+            '<div style="margin: 1rem 0; font-size: 0.95rem;">'
+            f'<span style="color: #059669;">✅ {self.passed} passed</span>'
+            " &nbsp; "
+            f'<span style="color: #dc2626;">❌ {self.failed} failed</span>'
+            f"{' &nbsp; ⏳ running...' if running else ''}"
+            "</div>"
+        )
+
+    def add(self, test: TestCaseResult) -> None:
+        """Show a single test result and update the counter"""
+        with self._lock:
+            if test.outcome == TestOutcome.PASS:
+                self.passed += 1
+            else:
+                self.failed += 1
+            self._update_counter(running=True)
+            self._results.append_display_data(HTML(test.to_html()))
+
+    def finish(self, output: TestResultOutput) -> None:
+        """Replace the streamed results with the complete test results"""
+        with self._lock:
+            # Keep the stylesheet sent with the streamed results
+            self.widget.children = (self._styles, *output.prepare_cells())
+
+
 @pytest.fixture
 def function_to_test():
     """Function to test, overridden at runtime by the cell magic"""
@@ -718,44 +1288,137 @@ def function_to_test():
 class FunctionInjectionPlugin:
     """A class to inject a function to test"""
 
-    def __init__(self, function_to_test: Callable) -> None:
+    def __init__(
+        self, function_to_test: Callable, function_id: str | None = None
+    ) -> None:
         self.function_to_test = function_to_test
+        self.function_id = function_id
 
     def pytest_generate_tests(self, metafunc: pytest.Metafunc) -> None:
         # Override the abstract `function_to_test` fixture function
         if "function_to_test" in metafunc.fixturenames:
-            metafunc.parametrize("function_to_test", [self.function_to_test])
+            metafunc.parametrize(
+                "function_to_test",
+                [self.function_to_test],
+                ids=[self.function_id] if self.function_id else None,
+            )
+
+
+class ProfilePlugin:
+    """A plugin to profile the solution function in each test"""
+
+    # How many functions to keep, the ones with the largest own time first
+    TOP_N: ClassVar[int] = 10
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item: pytest.Item):
+        funcargs = getattr(item, "funcargs", {})
+        if (function := funcargs.get("function_to_test")) is None:
+            return (yield)
+
+        profiler = cProfile.Profile()
+
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            try:
+                profiler.enable()
+            except ValueError:  # Another profiler is already active
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.disable()
+
+        funcargs["function_to_test"] = profiled_function
+        try:
+            return (yield)
+        finally:
+            funcargs["function_to_test"] = function
+            item.user_properties.append(("hotspots", self.hotspots(profiler)))
+
+    @classmethod
+    def hotspots(cls, profiler: cProfile.Profile) -> list[Hotspot]:
+        """The functions with the largest own time in a profile"""
+        try:
+            stats = pstats.Stats(profiler).stats  # type: ignore[attr-defined]
+        except TypeError:  # Nothing was profiled
+            return []
+
+        hotspots = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.items():
+            if "_lsprof.Profiler" in name:  # The calls enabling the profiler
+                continue
+            hotspots.append(
+                Hotspot(
+                    function=name
+                    if filename == "~"  # Built-in functions
+                    else f"{name} ({Path(filename).name}:{line})",
+                    calls=calls,
+                    total_time=own,
+                    cumulative_time=cumulative,
+                )
+            )
+        hotspots.sort(key=lambda hotspot: hotspot.total_time, reverse=True)
+        return hotspots[: cls.TOP_N]
+
+
+class MemoryTracePlugin:
+    """A plugin to measure the peak memory allocated by the solution function in a test"""
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item: pytest.Item):
+        funcargs = getattr(item, "funcargs", {})
+        if (function := funcargs.get("function_to_test")) is None:
+            return (yield)
+
+        peak = 0
+
+        @functools.wraps(function)
+        def traced_function(*args, **kwargs):
+            nonlocal peak
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            try:
+                return function(*args, **kwargs)
+            finally:
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+
+        # Only the solution is traced, not the reference solution called by the test
+        funcargs["function_to_test"] = traced_function
+        try:
+            return (yield)
+        finally:
+            funcargs["function_to_test"] = function
+            if started:
+                tracemalloc.stop()
+            item.user_properties.append(("memory_peak", peak))
 
 
 class ResultCollector:
     """A class that will collect the result of a test. If behaves a bit like a visitor pattern"""
 
-    def __init__(self) -> None:
+    def __init__(
+        self, on_result: Callable[[TestCaseResult], None] | None = None
+    ) -> None:
         self.tests: dict[str, TestCaseResult] = {}
+        self.on_result = on_result
 
     def pytest_runtest_makereport(self, item: pytest.Item, call: pytest.CallInfo):
         """Called when an individual test item has finished execution."""
         if call.when == "call":
-            test_result = TestCaseResult(
+            # The traceback is only formatted if someone wants to see it
+            self.tests[item.nodeid] = TestCaseResult(
                 test_name=item.nodeid,
                 outcome=TestOutcome.FAIL if call.excinfo else TestOutcome.PASS,
                 exception=call.excinfo.value if call.excinfo else None,
                 traceback=call.excinfo.tb if call.excinfo else None,
+                test_path=item.path.resolve(),
             )
 
-            if call.excinfo:
-                test_result.formatted_exception = str(
-                    call.excinfo.getrepr(
-                        showlocals=True,
-                        style="long",
-                        funcargs=True,
-                        abspath=False,
-                        chain=True,
-                    )
-                )
-
-            self.tests[item.nodeid] = test_result
-
     def pytest_exception_interact(
         self, call: pytest.CallInfo, report: pytest.TestReport
     ):
@@ -764,24 +1427,60 @@ class ResultCollector:
             # TODO: extract a stack summary from the traceback to inspect if the function to test raise an exception
             #    print([frame.name for frame in traceback.extract_tb(exc.tb)])
             # If something else than the test_* name is in that list, then we have a solution function that raised an exception
-            outcome = (
-                TestOutcome.FAIL
-                if exc.errisinstance(AssertionError)
-                or exc.errisinstance(pytest.fail.Exception)
-                else TestOutcome.TEST_ERROR
-            )
-            self.tests[report.nodeid] = TestCaseResult(
-                test_name=report.nodeid,
+            if exc.errisinstance(TestTimeoutError):
+                outcome = TestOutcome.TIMEOUT
+            elif exc.errisinstance((ResourceLimitError, MemoryError)):
+                outcome = TestOutcome.RESOURCE_LIMIT
+            elif exc.errisinstance(AssertionError) or exc.errisinstance(
+                pytest.fail.Exception
+            ):
+                outcome = TestOutcome.FAIL
+            else:
+                outcome = TestOutcome.TEST_ERROR
+            # Keep what was already collected, e.g., the duration of the call
+            self.tests[report.nodeid] = replace(
+                self.tests.get(report.nodeid)
+                or TestCaseResult(test_name=report.nodeid, outcome=outcome),
                 outcome=outcome,
                 exception=exc.value,
                 traceback=exc.tb,
             )
 
+    def stopped_by(self, item: pytest.Item) -> bool:
+        """Whether a test timed out or hit a resource limit, which the next tests would too"""
+        test = self.tests.get(item.nodeid)
+        return test is not None and test.outcome in (
+            TestOutcome.TIMEOUT,
+            TestOutcome.RESOURCE_LIMIT,
+        )
+
+    def mark_not_run(self, items: list[pytest.Item]) -> None:
+        """Record the tests that were left out after a run stopped early"""
+        for item in items:
+            test = TestCaseResult(test_name=item.nodeid, outcome=TestOutcome.NOT_RUN)
+            self.tests[item.nodeid] = test
+            if self.on_result is not None:
+                self.on_result(test)
+
     def pytest_runtest_logreport(self, report: pytest.TestReport):
         """Called to log the report of a test item."""
         if test_result := self.tests.get(report.nodeid):
-            test_result.stdout = report.capstdout
-            test_result.stderr = report.capstderr
+            if report.when == "call":
+                test_result.duration = report.duration
+                properties = dict(report.user_properties)
+                test_result.memory_peak = properties.get("memory_peak")
+                test_result.hotspots = properties.get("hotspots")
+
+            # The output of all the phases is in the teardown report
+            if report.when == "teardown":
+                test_result.stdout = CapturedOutput.from_text(report.capstdout)
+                test_result.stderr = CapturedOutput.from_text(report.capstderr)
 
             if report.failed:
-                test_result.report_output = str(report.longrepr)
+                test_result.report_output = truncate_text(
+                    str(report.longrepr), MAX_TRACEBACK_BYTES
+                )
+
+            # The teardown report is the last one of a test item
+            if report.when == "teardown" and self.on_result is not None:
+                self.on_result(test_result)
@@ -0,0 +1,240 @@
+"""A module to limit the time and memory a solution can use while tested"""
+
+import ctypes
+import dataclasses
+import os
+import signal
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from types import TracebackType
+from typing import ClassVar
+
+import pytest
+
+from .exceptions import (
+    CPUTimeLimitError,
+    InvalidLimitError,
+    TestTimeoutError,
+    UnknownLimitError,
+)
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None  # type: ignore
+
+# Default wall-clock limit of a single test, in seconds
+DEFAULT_TIMEOUT = 30.0
+
+# Extra time given to a worker process before it is considered stuck, in seconds
+WORKER_GRACE_PERIOD = 5.0
+
+
+def _float_from_env(name: str, default: float | None = None) -> float | None:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+@dataclasses.dataclass(frozen=True)
+class ResourceLimits:
+    """Limits applied to every test of a solution function"""
+
+    # Wall-clock time per test, in seconds
+    timeout: float | None = None
+    # CPU time per test, in seconds
+    cpu_time: float | None = None
+    # Address space of a worker process, in megabytes
+    memory_mb: float | None = None
+    # Whether `timeout` was given as an option, which takes precedence over a `timeout` marker
+    timeout_option: bool = False
+
+    @classmethod
+    def from_env(cls) -> "ResourceLimits":
+        """Default limits, configured with environment variables"""
+        return cls(
+            timeout=_float_from_env("IPYTEST_TIMEOUT", DEFAULT_TIMEOUT),
+            cpu_time=_float_from_env("IPYTEST_CPU_TIME"),
+            memory_mb=_float_from_env("IPYTEST_MEMORY_MB"),
+        )
+
+    # Names of the `%%ipytest` line options, e.g., `timeout=10`
+    OPTIONS: ClassVar[dict[str, str]] = {
+        "timeout": "timeout",
+        "cputime": "cpu_time",
+        "memory": "memory_mb",
+    }
+
+    def with_options(self, options: dict[str, str]) -> "ResourceLimits":
+        """Override the limits with the values given as line options"""
+        values = {}
+        for option, value in options.items():
+            if option not in self.OPTIONS:
+                raise UnknownLimitError(option)
+            try:
+                values[self.OPTIONS[option]] = float(value) if value else None
+            except ValueError as err:
+                raise InvalidLimitError(option, value) from err
+        return dataclasses.replace(
+            self, **values, timeout_option=self.timeout_option or "timeout" in options
+        )
+
+    def for_item(self, item: pytest.Item) -> "ResourceLimits":
+        """The limits of a test, whose `timeout` marker replaces the default wall-clock limit"""
+        if (
+            self.timeout_option
+            or (marker := item.get_closest_marker("timeout")) is None
+        ):
+            return self
+        seconds = marker.kwargs.get("timeout", marker.args[0] if marker.args else None)
+        return dataclasses.replace(self, timeout=float(seconds) if seconds else None)
+
+    @property
+    def worker_deadline(self) -> float | None:
+        """How long a worker may stay silent before it is killed"""
+        budgets = [limit for limit in (self.timeout, self.cpu_time) if limit]
+        return max(budgets) + WORKER_GRACE_PERIOD if budgets else None
+
+
+class _ThreadTimeoutError(TestTimeoutError):
+    """Raised in a thread by `PyThreadState_SetAsyncExc`, which cannot pass arguments"""
+
+    def __init__(self) -> None:
+        super().__init__(0)
+
+
+class _ThreadTimeout:
+    """
+    Interrupt the current thread with a `TestTimeoutError` after `seconds`.
+    Python code is interrupted, but not a call stuck in C code, e.g., `time.sleep`.
+    """
+
+    def __init__(self, seconds: float | None) -> None:
+        self.seconds = seconds
+        self.thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+        self._armed = False
+        self._timer: threading.Timer | None = None
+
+    def _interrupt(self) -> None:
+        # The lock orders this with the disarm: nothing is raised once the body returned
+        with self._lock:
+            if self._armed:
+                self._set_async_exception(_ThreadTimeoutError)
+
+    def _set_async_exception(self, error: type[BaseException] | None) -> None:
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(self.thread_id),
+            ctypes.py_object(error) if error is not None else None,
+        )
+
+    def __enter__(self) -> None:
+        if not self.seconds:
+            return
+        self._armed = True
+        self._timer = threading.Timer(self.seconds, self._interrupt)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._timer is None:
+            return
+        with self._lock:
+            self._armed = False
+            # An exception set just before the disarm may not have been raised yet
+            self._set_async_exception(None)
+        self._timer.cancel()
+
+        if exc_type is not None and issubclass(exc_type, _ThreadTimeoutError):
+            raise TestTimeoutError(self.seconds) from None
+
+
+class ResourceLimitPlugin:
+    """
+    A plugin to stop a test that runs for too long.
+    Off the main thread, e.g., with the `async` option, only the wall-clock limit applies.
+    """
+
+    def __init__(self, limits: ResourceLimits) -> None:
+        self.limits = limits
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item: pytest.Item):
+        limits = self.limits.for_item(item)
+
+        # Timers are delivered as signals, which only the main thread can handle:
+        # another thread is interrupted by a watchdog instead
+        if threading.current_thread() is not threading.main_thread():
+            with _ThreadTimeout(limits.timeout):
+                return (yield)
+
+        # Interval timers are not available on Windows
+        timers: list[tuple[int, int, float, type[BaseException]]] = []
+        if limits.timeout and hasattr(signal, "SIGALRM"):
+            timers.append(
+                (
+                    signal.ITIMER_REAL,
+                    signal.SIGALRM,
+                    limits.timeout,
+                    TestTimeoutError,
+                )
+            )
+        if limits.cpu_time and hasattr(signal, "SIGPROF"):
+            timers.append(
+                (
+                    signal.ITIMER_PROF,
+                    signal.SIGPROF,
+                    limits.cpu_time,
+                    CPUTimeLimitError,
+                )
+            )
+
+        previous_handlers = {}
+        for timer, signum, seconds, error in timers:
+
+            def handler(_signum, _frame, seconds=seconds, error=error):
+                raise error(seconds)
+
+            previous_handlers[signum] = signal.signal(signum, handler)
+            signal.setitimer(timer, seconds)
+
+        try:
+            return (yield)
+        finally:
+            for timer, signum, _, _ in timers:
+                signal.setitimer(timer, 0)
+                signal.signal(signum, previous_handlers[signum])
+
+
+def _address_space_in_use() -> int:
+    """Size of the address space of the current process, in bytes (Linux only)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+@contextmanager
+def address_space_limit(memory_mb: float | None) -> Iterator[None]:
+    """Cap the address space of the current process. Only use it in a worker process!"""
+    if not memory_mb or resource is None:
+        yield
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    # The cap is on top of what the worker already uses, e.g., for preloaded modules
+    limit = _address_space_in_use() + int(memory_mb * 1024 * 1024)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
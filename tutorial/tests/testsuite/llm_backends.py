@@ -0,0 +1,537 @@
+"""
+The chat backends of `OpenAIWrapper`: where the explanation requests are sent.
+
+- `openai`: the OpenAI API, the default
+- `local`: any OpenAI-compatible HTTP endpoint, e.g., a vLLM or Ollama server,
+  set with `IPYTEST_LLM_BASE_URL`
+- `fake`: deterministic explanations generated in-process, with a realistic latency,
+  e.g., to benchmark the explanation widgets offline
+
+The fake explanations can also be served over HTTP, to stand in for a local server:
+
+    python -m tutorial.tests.testsuite fake-llm --port 8000
+"""
+
+import abc
+import argparse
+import dataclasses
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+import typing as t
+import uuid
+
+import jiter
+import openai
+from openai.types.chat import (
+    ChatCompletionMessage,
+    ChatCompletionMessageParam,
+    ParsedChatCompletionMessage,
+)
+from pydantic import BaseModel
+
+from .exceptions import (
+    APIConnectionError,
+    InvalidAPIKeyError,
+    UnexpectedAPIError,
+    ValidationResult,
+)
+
+
+@dataclasses.dataclass
+class ChatResult:
+    """The message of a chat completion, and the tokens it used if known"""
+
+    message: ParsedChatCompletionMessage | ChatCompletionMessage
+    total_tokens: int | None = None
+
+
+class ChatBackend(abc.ABC):
+    """An API that answers chat requests with structured responses"""
+
+    # The model used if none is configured
+    default_model: str = ""
+
+    @abc.abstractmethod
+    def validate(self) -> ValidationResult:
+        """Check that the backend can be reached and used"""
+
+    @abc.abstractmethod
+    def models(self) -> tuple[str, ...] | None:
+        """The models that can be used, or `None` if any model can be"""
+
+    @abc.abstractmethod
+    def parse(
+        self,
+        model: str,
+        messages: list[ChatCompletionMessageParam],
+        response_format: type[BaseModel],
+        **kwargs: t.Any,
+    ) -> ChatResult:
+        """Fetch a completion parsed as `response_format`"""
+
+    @abc.abstractmethod
+    def stream(
+        self,
+        model: str,
+        messages: list[ChatCompletionMessageParam],
+        response_format: type[BaseModel],
+        on_partial: t.Callable[[dict[str, t.Any]], None],
+        **kwargs: t.Any,
+    ) -> ChatResult:
+        """Fetch a completion token by token, calling `on_partial` with the fields parsed so far"""
+
+
+class OpenAICompatibleBackend(ChatBackend):
+    """A backend talking to the OpenAI API, or to a server implementing it"""
+
+    def __init__(self, client: openai.OpenAI) -> None:
+        self.client = client
+
+    def parse(self, model, messages, response_format, **kwargs) -> ChatResult:
+        response = self.client.beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            response_format=response_format,
+            **kwargs,
+        )
+        return ChatResult(
+            response.choices[0].message,
+            response.usage.total_tokens if response.usage else None,
+        )
+
+    def stream(
+        self, model, messages, response_format, on_partial, **kwargs
+    ) -> ChatResult:
+        with self.client.beta.chat.completions.stream(
+            model=model,
+            messages=messages,
+            response_format=response_format,
+            **kwargs,
+        ) as stream:
+            for event in stream:
+                if event.type == "content.delta" and isinstance(event.parsed, dict):
+                    on_partial(event.parsed)
+            response = stream.get_final_completion()
+
+        return ChatResult(
+            response.choices[0].message,
+            response.usage.total_tokens if response.usage else None,
+        )
+
+
+class OpenAIBackend(OpenAICompatibleBackend):
+    """The OpenAI API"""
+
+    default_model = "gpt-4o-mini"
+
+    # These are the models we can use: they must support structured responses
+    GPT_MODELS = (
+        "gpt-4o",
+        "gpt-4o-mini",
+        "gpt-4.1",
+        "gpt-4.1-mini",
+        "gpt-4.1-nano",
+        "o4-mini",
+    )
+
+    def __init__(self, api_key: str | None) -> None:
+        self.api_key = api_key
+        super().__init__(openai.OpenAI(api_key=api_key or "missing"))
+
+    def models(self) -> tuple[str, ...]:
+        return self.GPT_MODELS
+
+    def validate(self) -> ValidationResult:
+        """Validate the OpenAI API key"""
+        if not self.api_key:
+            return ValidationResult(
+                is_valid=False,
+                error=InvalidAPIKeyError("API key is missing."),
+                message="OpenAI API key is not provided.",
+            )
+
+        try:
+            self.client.models.list()  # the simplest API call to verify the API
+        except openai.AuthenticationError:
+            return ValidationResult(
+                is_valid=False,
+                error=InvalidAPIKeyError("The provided API key is invalid."),
+                message="Invalid OpenAI API key. Please, double check it.",
+            )
+        except openai.APIConnectionError:
+            return ValidationResult(
+                is_valid=False,
+                error=APIConnectionError("Unable to connect to OpenAI."),
+                message="Could not connect to OpenAI. Please, check your internet connection.",
+            )
+        except Exception as e:
+            return ValidationResult(
+                is_valid=False,
+                error=UnexpectedAPIError(f"Unexpected error: {e}"),
+                message="An unexpected error occurred while validating API key.",
+            )
+        else:
+            return ValidationResult(is_valid=True)
+
+
+class LocalBackend(OpenAICompatibleBackend):
+    """A server implementing the OpenAI API, e.g., in an air-gapped network"""
+
+    def __init__(self, base_url: str, api_key: str | None = None) -> None:
+        self.base_url = base_url
+        # Local servers usually ignore the key, but the client requires one
+        super().__init__(openai.OpenAI(base_url=base_url, api_key=api_key or "local"))
+        self._models: tuple[str, ...] | None = None
+
+    def models(self) -> tuple[str, ...] | None:
+        """The models the server lists, or any model if it does not list them"""
+        if self._models is None:
+            try:
+                self._models = tuple(model.id for model in self.client.models.list())
+            except openai.APIError:
+                return None
+        return self._models or None
+
+    @property
+    def default_model(self) -> str:  # type: ignore[override]
+        """The first model listed by the server, once it was validated"""
+        return self._models[0] if self._models else ""
+
+    def validate(self) -> ValidationResult:
+        try:
+            self._models = tuple(model.id for model in self.client.models.list())
+        except openai.APIConnectionError:
+            return ValidationResult(
+                is_valid=False,
+                error=APIConnectionError(f"Unable to connect to {self.base_url}."),
+                message="Could not connect to the local model server.",
+            )
+        except openai.AuthenticationError:
+            return ValidationResult(
+                is_valid=False,
+                error=InvalidAPIKeyError("The local server rejected the API key."),
+                message="Invalid API key for the local model server.",
+            )
+        except openai.NotFoundError:
+            # Some servers do not implement the models endpoint
+            pass
+        except Exception as e:
+            return ValidationResult(
+                is_valid=False,
+                error=UnexpectedAPIError(f"Unexpected error: {e}"),
+                message="An unexpected error occurred while contacting the local model server.",
+            )
+        return ValidationResult(is_valid=True)
+
+
+@dataclasses.dataclass(frozen=True)
+class LatencyProfile:
+    """How long a fake completion takes: a delay before the first token, then a steady rate"""
+
+    first_token: float = 0.0
+    tokens_per_second: float = 0.0  # 0 means instantly
+    # Relative random variation of both, drawn from a seeded generator
+    jitter: float = 0.0
+
+
+LATENCY_PROFILES = {
+    "instant": LatencyProfile(),
+    "fast": LatencyProfile(first_token=0.3, tokens_per_second=150, jitter=0.1),
+    "typical": LatencyProfile(first_token=0.8, tokens_per_second=60, jitter=0.2),
+    "slow": LatencyProfile(first_token=3.0, tokens_per_second=15, jitter=0.3),
+}
+
+# Characters per token of the fake completions
+FAKE_TOKEN_CHARS = 4
+
+
+def fake_explanation(query: str) -> dict[str, t.Any]:
+    """A deterministic explanation of the error quoted in a query"""
+    error = next(
+        (
+            line.strip()
+            for line in reversed(query.splitlines())
+            if re.match(r"\s*\w+(Error|Exception)\b", line)
+        ),
+        "the error",
+    )
+    digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+
+    return {
+        "summary": f"Your function raised `{error}`.",
+        "steps": [
+            {
+                "title": "Read the error",
+                "content": f"The last line of the traceback says `{error}`. "
+                "It tells you what went wrong, and the lines above tell you where.",
+            },
+            {
+                "title": "Compare with the docstring",
+                "content": "Check the arguments and the return value against "
+                "the ones described in the docstring.",
+            },
+        ],
+        "code_snippets": [
+            {
+                "code": "print(repr(result))",
+                "description": "Print the value your function returns to inspect it.",
+            }
+        ],
+        "hints": [
+            f"Test your function on the smallest input you can think of ({digest}).",
+        ],
+    }
+
+
+class FakeBackend(ChatBackend):
+    """
+    Deterministic completions generated in-process, for tests and offline benchmarks.
+    The same query always gets the same explanation, delivered with the latency of `profile`.
+    """
+
+    default_model = "fake"
+
+    def __init__(
+        self,
+        profile: LatencyProfile = LATENCY_PROFILES["typical"],
+        seed: int = 0,
+        respond: t.Callable[[str], dict[str, t.Any]] = fake_explanation,
+    ) -> None:
+        self.profile = profile
+        self.respond = respond
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def validate(self) -> ValidationResult:
+        return ValidationResult(is_valid=True)
+
+    def models(self) -> tuple[str, ...] | None:
+        return None
+
+    def _jittered(self, value: float) -> float:
+        with self._lock:
+            factor = 1 + self._random.uniform(-1, 1) * self.profile.jitter
+        return max(0.0, value * factor)
+
+    def generate(self, messages: list[ChatCompletionMessageParam]) -> t.Iterator[str]:
+        """The chunks of the completion of `messages`, each one yielded after its delay"""
+        with self._lock:
+            self.requests += 1
+
+        content = json.dumps(self.respond(str(messages[-1].get("content") or "")))
+
+        time.sleep(self._jittered(self.profile.first_token))
+        delay = (
+            1 / self._jittered(self.profile.tokens_per_second)
+            if self.profile.tokens_per_second
+            else 0.0
+        )
+        for i in range(0, len(content), FAKE_TOKEN_CHARS):
+            time.sleep(delay)
+            yield content[i : i + FAKE_TOKEN_CHARS]
+
+    @staticmethod
+    def usage(messages: list[ChatCompletionMessageParam], content: str) -> int:
+        """The tokens of a fake completion, counted like the chunks"""
+        prompt = "".join(str(message.get("content") or "") for message in messages)
+        return (len(prompt) + len(content)) // FAKE_TOKEN_CHARS
+
+    def _result(
+        self,
+        messages: list[ChatCompletionMessageParam],
+        response_format: type[BaseModel],
+        content: str,
+    ) -> ChatResult:
+        return ChatResult(
+            ParsedChatCompletionMessage[response_format](  # type: ignore[valid-type]
+                role="assistant",
+                content=content,
+                parsed=response_format.model_validate_json(content),
+            ),
+            total_tokens=self.usage(messages, content),
+        )
+
+    def parse(self, model, messages, response_format, **kwargs) -> ChatResult:
+        return self._result(messages, response_format, "".join(self.generate(messages)))
+
+    def stream(
+        self, model, messages, response_format, on_partial, **kwargs
+    ) -> ChatResult:
+        content = ""
+        for chunk in self.generate(messages):
+            content += chunk
+            parsed = jiter.from_json(
+                content.encode("utf-8"), partial_mode="trailing-strings"
+            )
+            if isinstance(parsed, dict):
+                on_partial(parsed)
+        return self._result(messages, response_format, content)
+
+
+class _FakeServerHandler(http.server.BaseHTTPRequestHandler):
+    """The chat completions and models endpoints of the OpenAI API, answered by a `FakeBackend`"""
+
+    server: "FakeServer"
+
+    def log_message(self, *args: t.Any) -> None:
+        pass
+
+    def _send_json(self, payload: dict[str, t.Any], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(
+                {
+                    "object": "list",
+                    "data": [
+                        {
+                            "id": FakeBackend.default_model,
+                            "object": "model",
+                            "created": 0,
+                            "owned_by": "ipytest",
+                        }
+                    ],
+                }
+            )
+        else:
+            self._send_json({"error": {"message": "Not found"}}, status=404)
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "Not found"}}, status=404)
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        messages = request.get("messages", [])
+        completion = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": request.get("model", FakeBackend.default_model),
+        }
+
+        if not request.get("stream"):
+            content = "".join(self.server.backend.generate(messages))
+            tokens = self.server.backend.usage(messages, content)
+            self._send_json(
+                {
+                    **completion,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": tokens,
+                        "total_tokens": tokens,
+                    },
+                }
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send_chunk(delta: dict[str, t.Any], finish_reason: str | None) -> None:
+            chunk = {
+                **completion,
+                "object": "chat.completion.chunk",
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        send_chunk({"role": "assistant", "content": ""}, None)
+        for text in self.server.backend.generate(messages):
+            send_chunk({"content": text}, None)
+        send_chunk({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class FakeServer(http.server.ThreadingHTTPServer):
+    """
+    An OpenAI-compatible server answering with a `FakeBackend`, to use with `LocalBackend`,
+    e.g., to load-test a classroom without an external API:
+
+        python -m tutorial.tests.testsuite fake-llm --port 8000 --profile typical
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], backend: FakeBackend) -> None:
+        super().__init__(address, _FakeServerHandler)
+        self.backend = backend
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The arguments of the `fake-llm` command"""
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(LATENCY_PROFILES),
+        default="typical",
+        help="latency of the completions",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the latency variations"
+    )
+
+
+def main(args: argparse.Namespace) -> int:
+    """Serve fake completions until interrupted"""
+    server = FakeServer(
+        (args.host, args.port),
+        FakeBackend(LATENCY_PROFILES[args.profile], seed=args.seed),
+    )
+    print(
+        f"Serving fake completions on http://{args.host}:{server.server_port}/v1, "
+        f"set IPYTEST_LLM_BACKEND=local and IPYTEST_LLM_BASE_URL to use it"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def backend_from_env(api_key: str | None) -> ChatBackend:
+    """
+    The backend selected with `IPYTEST_LLM_BACKEND`: `openai` (default), `local`, or `fake`.
+    The local backend needs `IPYTEST_LLM_BASE_URL`, and the fake one reads `IPYTEST_LLM_FAKE_PROFILE`.
+    """
+    match os.getenv("IPYTEST_LLM_BACKEND", "openai").lower():
+        case "local":
+            return LocalBackend(
+                os.getenv("IPYTEST_LLM_BASE_URL", "http://localhost:8000/v1"), api_key
+            )
+        case "fake":
+            return FakeBackend(
+                LATENCY_PROFILES.get(
+                    os.getenv("IPYTEST_LLM_FAKE_PROFILE", "typical"),
+                    LATENCY_PROFILES["typical"],
+                )
+            )
+        case _:
+            return OpenAIBackend(api_key)
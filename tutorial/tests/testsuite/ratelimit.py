@@ -0,0 +1,166 @@
+"""A module to limit the rate of the AI requests of a kernel, and to count down until the next one"""
+
+import os
+import threading
+import time
+import typing as t
+import weakref
+
+# Budgets of the whole kernel, configured with environment variables
+DEFAULT_REQUESTS_PER_MINUTE = 5
+DEFAULT_TOKENS_PER_MINUTE = 40_000
+
+# Tokens a request is assumed to use until its actual usage is known
+EXPECTED_COMPLETION_TOKENS = 1_000
+
+
+def estimate_tokens(text: str) -> int:
+    """A rough count of the tokens of a prompt, about four characters each"""
+    return len(text) // 4 + EXPECTED_COMPLETION_TOKENS
+
+
+class TokenBucket:
+    """A bucket of `capacity` tokens, refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available"""
+        self._refill()
+        # A request larger than the bucket only waits for a full bucket
+        missing = min(amount, self.capacity) - self._tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def consume(self, amount: float) -> None:
+        """Take tokens, possibly more than available: the debt delays the next requests"""
+        self._refill()
+        self._tokens -= amount
+
+
+class RateLimiter:
+    """
+    Limits the requests and the tokens per minute of all the AI explanations of a kernel.
+    Requests are charged an estimate of their tokens, corrected once their usage is known.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+    ) -> None:
+        self._requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self._lock = threading.Lock()
+
+    def wait_time(self, tokens: int = EXPECTED_COMPLETION_TOKENS) -> float:
+        """Seconds until a request of `tokens` tokens can be sent"""
+        with self._lock:
+            return max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+
+    def acquire(self, tokens: int = EXPECTED_COMPLETION_TOKENS) -> None:
+        """Wait until a request of `tokens` tokens can be sent, and charge it"""
+        while True:
+            with self._lock:
+                wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                if wait <= 0:
+                    self._requests.consume(1)
+                    self._tokens.consume(tokens)
+                    return
+            time.sleep(wait)
+
+    def record_usage(self, estimated: int, actual: int | None) -> None:
+        """Charge the difference between the actual usage of a request and its estimate"""
+        if actual is None:
+            return
+        with self._lock:
+            self._tokens.consume(actual - estimated)
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the per-kernel rate limiter.
+    Configured with `IPYTEST_AI_REQUESTS_PER_MINUTE` and `IPYTEST_AI_TOKENS_PER_MINUTE`.
+    """
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=float(
+                    os.getenv(
+                        "IPYTEST_AI_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE
+                    )
+                ),
+                tokens_per_minute=float(
+                    os.getenv("IPYTEST_AI_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE)
+                ),
+            )
+
+    return _limiter
+
+
+class CountdownScheduler:
+    """
+    A single thread calling the `tick()` method of all the counting down widgets once per second.
+    A widget's `tick()` returns `False` once its countdown is over, and the widget is then forgotten.
+    The thread waits without ticking while there is nothing to count down.
+    """
+
+    INTERVAL = 1.0
+
+    def __init__(self) -> None:
+        # A widget that is gone stops counting down
+        self._widgets: weakref.WeakSet[t.Any] = weakref.WeakSet()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def add(self, widget: t.Any) -> None:
+        """Call `widget.tick()` every second until it returns `False`"""
+        with self._condition:
+            self._widgets.add(widget)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ai-countdown", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._widgets:
+                    self._condition.wait()
+            time.sleep(self.INTERVAL)
+            self._tick()
+
+    def _tick(self) -> None:
+        with self._condition:
+            widgets = list(self._widgets)
+
+        for widget in widgets:
+            try:
+                running = widget.tick()
+            except Exception:
+                running = False
+            if not running:
+                with self._condition:
+                    self._widgets.discard(widget)
+
+
+# Shared by all the widgets of a kernel
+countdowns = CountdownScheduler()
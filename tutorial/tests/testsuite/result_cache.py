@@ -0,0 +1,245 @@
+"""A module to cache the test results of unchanged solutions"""
+
+import dataclasses
+import hashlib
+import inspect
+import io
+import os
+import pathlib
+import pickle
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from types import CellType, CodeType, ModuleType
+
+from .helpers import AFunction, IPytestResult
+
+DEFAULT_CACHE_SIZE = 128
+
+
+class _FingerprintError(Exception):
+    """Raised when a value has no content fingerprint, e.g., an open file or a lock"""
+
+
+class _FingerprintPickler(pickle.Pickler):
+    """A pickler that replaces the functions and classes of `__main__` by their fingerprint"""
+
+    def __init__(self, file: io.BytesIO, fingerprint: Callable[[object], str]) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.fingerprint = fingerprint
+
+    def persistent_id(self, obj: object) -> str | None:
+        if (inspect.isclass(obj) or inspect.isfunction(obj)) and getattr(
+            obj, "__module__", None
+        ) == "__main__":
+            return self.fingerprint(obj)
+        return None
+
+
+def _referenced_names(code: CodeType) -> set[str]:
+    """Collect the global names used by a code object and the ones nested in it"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _referenced_names(const)
+    return names
+
+
+class _Fingerprinter:
+    """
+    Fingerprints the content of the values a solution depends on: the bytecode,
+    constants, defaults and closures of functions, and the pickled state of data.
+    Ids are not used: CPython reuses the id of a freed object for a new one.
+    """
+
+    def __init__(self) -> None:
+        self._fingerprints: dict[int, str] = {}
+        # Keeps the fingerprinted values alive, so that their ids are not reused meanwhile
+        self._values: list[object] = []
+
+    def _code(self, code: CodeType) -> tuple:
+        return (
+            code.co_code,
+            code.co_names,
+            code.co_varnames,
+            code.co_freevars,
+            tuple(
+                self._code(const) if isinstance(const, CodeType) else repr(const)
+                for const in code.co_consts
+            ),
+        )
+
+    def _cell(self, cell: CellType) -> str:
+        try:
+            return self(cell.cell_contents)
+        except ValueError:
+            # Not assigned yet
+            return "<empty>"
+
+    def _globals(self, code: CodeType, namespace: dict) -> list[tuple[str, str]]:
+        return sorted(
+            (name, self(namespace[name]))
+            for name in _referenced_names(code)
+            if name in namespace
+        )
+
+    def _content(self, value: object) -> object:
+        if isinstance(value, ModuleType):
+            return ("module", value.__name__)
+
+        if isinstance(value, staticmethod | classmethod):
+            return (type(value).__name__, self(value.__func__))
+
+        if isinstance(value, property):
+            return ("property", self(value.fget), self(value.fset), self(value.fdel))
+
+        if inspect.isclass(value) or callable(value):
+            if getattr(value, "__module__", None) != "__main__":
+                # Defined in a module, which does not change while the kernel runs
+                if hasattr(value, "__qualname__"):
+                    return ("global", value.__module__, value.__qualname__)
+            elif inspect.isfunction(value):
+                return (
+                    "function",
+                    self._code(value.__code__),
+                    self(value.__defaults__),
+                    self(value.__kwdefaults__),
+                    [self._cell(cell) for cell in value.__closure__ or ()],
+                    self._globals(value.__code__, value.__globals__),
+                )
+            elif inspect.isclass(value):
+                return (
+                    "class",
+                    value.__qualname__,
+                    [self(base) for base in value.__bases__],
+                    sorted(
+                        (name, self(attribute))
+                        for name, attribute in vars(value).items()
+                        if name not in ("__dict__", "__weakref__")
+                    ),
+                )
+            elif (wrapped := getattr(value, "__wrapped__", None)) is not None:
+                # E.g., a helper decorated with `functools.cache`
+                return ("wrapper", type(value).__qualname__, self(wrapped))
+
+        buffer = io.BytesIO()
+        try:
+            _FingerprintPickler(buffer, self).dump(value)
+        except Exception as err:
+            raise _FingerprintError from err
+        return ("data", buffer.getvalue())
+
+    def __call__(self, value: object) -> str:
+        """The fingerprint of a value, which only changes with its content"""
+        if value is None or isinstance(value, bool | int | float | str | bytes):
+            return repr(value)
+
+        key = id(value)
+        if key not in self._fingerprints:
+            # A placeholder for the recursive references, e.g., of a recursive function
+            self._fingerprints[key] = f"<recursive {len(self._fingerprints)}>"
+            self._values.append(value)
+            self._fingerprints[key] = hashlib.sha256(
+                repr(self._content(value)).encode("utf-8")
+            ).hexdigest()
+
+        return self._fingerprints[key]
+
+
+def _globals_signature(function: AFunction) -> list[tuple[str, str]]:
+    """The fingerprints of the globals the solution function refers to"""
+    implementation = function.implementation
+    code = getattr(implementation, "__code__", None)
+    namespace = getattr(implementation, "__globals__", None)
+
+    if code is None or namespace is None:
+        return []
+
+    fingerprint = _Fingerprinter()
+    return sorted(
+        (name, fingerprint(namespace[name]))
+        for name in _referenced_names(code)
+        if name in namespace
+    )
+
+
+def result_cache_key(
+    module_file: pathlib.Path, function: AFunction, *options: str
+) -> str | None:
+    """
+    Build the cache key of a test run from the solution's source code,
+    the content of the test module, and the content of the solution's globals.
+    Returns `None` if a global has no content fingerprint: the run must not be cached.
+    """
+    try:
+        signature = _globals_signature(function)
+    except _FingerprintError:
+        return None
+
+    key = hashlib.sha256()
+    key.update((function.source_code or "").encode("utf-8"))
+    key.update(hashlib.sha256(module_file.read_bytes()).digest())
+    key.update(repr(signature).encode("utf-8"))
+    key.update(repr(sorted(options)).encode("utf-8"))
+    return key.hexdigest()
+
+
+def _snapshot(result: IPytestResult) -> IPytestResult:
+    """
+    A copy of a result for the cache, so that the displayed result is left alone.
+    The tracebacks are kept as they are: they are formatted only if a cache hit shows them.
+    """
+    return dataclasses.replace(
+        result,
+        test_results=[dataclasses.replace(test) for test in result.test_results]
+        if result.test_results is not None
+        else None,
+    )
+
+
+class ResultCache:
+    """A size-bounded LRU cache of test results"""
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._results: OrderedDict[str, IPytestResult] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key: str) -> IPytestResult | None:
+        """Return the cached result, marked as such, or `None`"""
+        with self._lock:
+            if (result := self._results.get(key)) is None:
+                return None
+            self._results.move_to_end(key)
+
+        return dataclasses.replace(result, cached=True)
+
+    def put(self, key: str, result: IPytestResult) -> None:
+        """Store a result, evicting the least recently used ones if needed"""
+        with self._lock:
+            self._results[key] = _snapshot(result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def spill_files(self) -> set[str]:
+        """The files of the full outputs that the cached results still show"""
+        with self._lock:
+            return {
+                str(output.spill_file)
+                for result in self._results.values()
+                for output in result.spilled_outputs()
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+# Per-kernel cache of the test results
+result_cache = ResultCache(
+    max(0, int(os.getenv("IPYTEST_RESULT_CACHE_SIZE", DEFAULT_CACHE_SIZE)))
+)
@@ -0,0 +1,232 @@
+"""A module to keep pytest sessions alive across `%%ipytest` runs"""
+
+import dataclasses
+import io
+import pathlib
+import sys
+import threading
+from collections.abc import Callable
+from contextlib import redirect_stderr, redirect_stdout
+
+import pytest
+
+# Private APIs, which may change in any major release: pytest is pinned below the next one
+from _pytest.config import _prepareconfig
+from _pytest.mark import KeywordMatcher
+from _pytest.mark.expression import Expression
+
+from . import complexity
+from .helpers import (
+    FunctionInjectionPlugin,
+    MemoryTracePlugin,
+    ProfilePlugin,
+    ResultCollector,
+    RunOptions,
+    TestCaseResult,
+)
+from .limits import ResourceLimitPlugin, ResourceLimits
+
+# The id used for the `function_to_test` parameter when collecting the test items
+PLACEHOLDER_ID = "function_to_test"
+
+
+def _placeholder_function(*args, **kwargs):
+    """Stand-in injected at collection time, replaced by the solution on each run"""
+    raise NotImplementedError("No solution function was injected")
+
+
+class TestModuleSession:
+    """
+    A long-lived pytest session bound to a single test module.
+
+    The module is imported and collected only once. The collected items are
+    indexed by the name of the solution function they test, and each run only
+    executes the matching items with the solution injected as `function_to_test`.
+    """
+
+    __test__ = False  # not a test class, even if its name starts with "Test"
+
+    def __init__(self, module_file: pathlib.Path) -> None:
+        self.module_file = module_file
+        self.mtime_ns = module_file.stat().st_mtime_ns
+        self.items_by_name: dict[str, list[pytest.Item]] = {}
+        self.collection_failed = False
+        self._lock = threading.RLock()
+
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            self.config = _prepareconfig(
+                [str(module_file)],
+                plugins=[
+                    FunctionInjectionPlugin(_placeholder_function, PLACEHOLDER_ID),
+                    # Fixtures that test modules can request
+                    complexity,
+                ],
+            )
+            self.config._do_configure()
+            # Nobody reads the terminal output of a cached session
+            self.config.pluginmanager.unregister(name="terminalreporter")
+
+            self.session = pytest.Session.from_config(self.config)
+            self.config.hook.pytest_sessionstart(session=self.session)
+            self.config.hook.pytest_collection(session=self.session)
+
+        self.collection_failed = self.session.testsfailed > 0
+
+    def is_stale(self) -> bool:
+        """Whether the test module changed on disk since it was collected"""
+        try:
+            return self.module_file.stat().st_mtime_ns != self.mtime_ns
+        except FileNotFoundError:
+            return True
+
+    def items_for(self, name: str) -> list[pytest.Item]:
+        """Return the items selected by `-k test_<name>`, computed once per name"""
+        if name not in self.items_by_name:
+            expression = Expression.compile(f"test_{name}")
+            self.items_by_name[name] = [
+                item
+                for item in self.session.items
+                if expression.evaluate(KeywordMatcher.from_item(item))
+            ]
+
+        return self.items_by_name[name]
+
+    def worker_deadline(self, name: str, limits: ResourceLimits) -> float | None:
+        """How long a worker may stay silent while testing `name`, given the `timeout` markers"""
+        deadlines = [
+            limits.for_item(item).worker_deadline for item in self.items_for(name)
+        ] or [limits.worker_deadline]
+        return None if None in deadlines else max(deadlines)  # type: ignore[type-var]
+
+    @staticmethod
+    def test_name(nodeid: str, function_id: str | None) -> str:
+        """The test name pytest would have generated for a function named `function_id`"""
+        if function_id is None:
+            return nodeid
+        return nodeid.replace(f"[{PLACEHOLDER_ID}", f"[{function_id}", 1)
+
+    def run(
+        self,
+        name: str,
+        implementation: Callable,
+        on_result: Callable[[TestCaseResult], None] | None = None,
+        options: RunOptions | None = None,
+    ) -> tuple[pytest.ExitCode, ResultCollector]:
+        """Run the items testing `name` with `implementation` injected"""
+        options = options or RunOptions()
+        function_id = getattr(implementation, "__name__", None)
+
+        def renamed(test: TestCaseResult) -> TestCaseResult:
+            return dataclasses.replace(
+                test, test_name=self.test_name(test.test_name, function_id)
+            )
+
+        result_collector = ResultCollector(
+            (lambda test: on_result(renamed(test))) if on_result is not None else None
+        )
+        plugins = [result_collector, ResourceLimitPlugin(options.limits)]
+        if options.trace_memory:
+            plugins.append(MemoryTracePlugin())
+        if options.profile:
+            plugins.append(ProfilePlugin())
+
+        with self._lock:
+            if self.collection_failed:
+                return pytest.ExitCode.INTERRUPTED, result_collector
+
+            items = self.items_for(name)
+            if not items:
+                return pytest.ExitCode.NO_TESTS_COLLECTED, result_collector
+
+            if options.failed_first:
+                # The sort is stable: the other items keep their order
+                items = sorted(
+                    items,
+                    key=lambda item: (
+                        self.test_name(item.nodeid, function_id)
+                        not in options.failed_first
+                    ),
+                )
+
+            for plugin in plugins:
+                self.config.pluginmanager.register(plugin)
+            self.session.testsfailed = 0
+            self.session.shouldfail = False
+            self.session.shouldstop = False
+
+            try:
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    for i, item in enumerate(items):
+                        item.callspec.params["function_to_test"] = implementation
+                        # Drop the captured output and the properties of the previous run
+                        item._report_sections = []
+                        item.user_properties = []
+                        next_item = items[i + 1] if i + 1 < len(items) else None
+                        self.config.hook.pytest_runtest_protocol(
+                            item=item, nextitem=next_item
+                        )
+                        if (options.failfast and self.session.testsfailed) or (
+                            self.session.shouldfail or self.session.shouldstop
+                        ):
+                            break
+                        # A solution that never finishes would only wait for each timeout
+                        if result_collector.stopped_by(item):
+                            result_collector.mark_not_run(items[i + 1 :])
+                            break
+                    # Tear down the fixtures still set up if we stopped early
+                    self.session._setupstate.teardown_exact(None)
+            except Exception:
+                return pytest.ExitCode.INTERNAL_ERROR, result_collector
+            finally:
+                for plugin in plugins:
+                    self.config.pluginmanager.unregister(plugin)
+
+        # Restore the test names that pytest would have generated for `implementation`
+        result_collector.tests = {
+            nodeid: renamed(test) for nodeid, test in result_collector.tests.items()
+        }
+
+        return (
+            pytest.ExitCode.TESTS_FAILED
+            if self.session.testsfailed
+            else pytest.ExitCode.OK
+        ), result_collector
+
+    def close(self) -> None:
+        """Tear down the session and forget the imported test module"""
+        with self._lock:
+            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                self.config._ensure_unconfigure()
+
+            for module_name, module in list(sys.modules.items()):
+                if getattr(module, "__file__", None) == str(self.module_file.resolve()):
+                    del sys.modules[module_name]
+
+
+# Per-kernel cache of the collected test modules
+_sessions: dict[pathlib.Path, TestModuleSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_test_session(module_file: pathlib.Path) -> TestModuleSession:
+    """Return the cached session for a test module, collecting it again if it changed"""
+    key = module_file.resolve()
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+
+        if session is None or session.is_stale() or session.collection_failed:
+            if session is not None:
+                session.close()
+            session = TestModuleSession(module_file)
+            _sessions[key] = session
+
+    return session
+
+
+def clear_test_sessions() -> None:
+    """Close all the cached sessions"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,62 @@
+"""A module to send the stylesheets of the result widgets only once per cell output"""
+
+import threading
+from collections import OrderedDict
+
+from IPython.core.getipython import get_ipython
+
+# How many cell executions to remember the sent stylesheets for
+MAX_SCOPES = 64
+
+
+def _current_scope() -> str:
+    """The ID of the message being executed, i.e., of the cell output being written"""
+    shell = get_ipython()
+    header = getattr(shell, "parent_header", None) or {}
+    return str(header.get("header", {}).get("msg_id", ""))
+
+
+class StyleRegistry:
+    """
+    Registry of the CSS blocks used by the result widgets.
+    HTML fragments only reference the classes, and each block is sent once per cell output:
+    the styles disappear with the output they were sent with, e.g., when the cell is run again.
+    """
+
+    def __init__(self) -> None:
+        self._sheets: dict[str, str] = {}
+        # Cell execution -> names of the stylesheets already sent to its output
+        self._sent: OrderedDict[str, set[str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, css: str) -> str:
+        """Register a CSS block and return its name"""
+        self._sheets[name] = css
+        return name
+
+    def html(self, *names: str) -> str:
+        """The `<style>` tags of the stylesheets not sent yet to the current cell output"""
+        scope = _current_scope()
+
+        with self._lock:
+            sent = self._sent.setdefault(scope, set())
+            self._sent.move_to_end(scope)
+            while len(self._sent) > MAX_SCOPES:
+                self._sent.popitem(last=False)
+
+            missing = [name for name in names if name not in sent]
+            sent.update(missing)
+
+        return "".join(
+            f'<style data-ipytest-style="{name}">{self._sheets[name]}</style>'
+            for name in missing
+        )
+
+    def clear(self) -> None:
+        """Forget which stylesheets were sent, e.g., after the front end reloaded"""
+        with self._lock:
+            self._sent.clear()
+
+
+# Shared by all the widgets of a kernel
+stylesheets = StyleRegistry()
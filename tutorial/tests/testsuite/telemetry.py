@@ -0,0 +1,312 @@
+"""
+A module to record one JSON line per test run, for cohort-level metrics.
+
+Recording is enabled by setting `IPYTEST_TELEMETRY_FILE` to the path of a JSONL file.
+The records are written by a background thread, and a cell never waits for them.
+
+Summarize a file with:
+
+    python -m tutorial.tests.testsuite telemetry telemetry.jsonl
+"""
+
+import argparse
+import atexit
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from queue import Empty, Full, Queue
+from typing import Any
+
+from .helpers import IPytestOutcome, IPytestResult, TestOutcome
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None  # type: ignore
+
+# Identifies the records of the same kernel, e.g., to compute the time to first pass
+SESSION_ID = uuid.uuid4().hex
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+
+def result_record(module_name: str, result: IPytestResult) -> dict[str, Any]:
+    """A compact, JSON-serializable summary of a test run"""
+    tests = result.test_results or []
+    outcomes = collections.Counter(test.outcome.name for test in tests)
+    failure = next(
+        (
+            type(exception).__name__
+            for exception in [
+                *(test.exception for test in tests if test.outcome != TestOutcome.PASS),
+                *(result.exceptions or []),
+            ]
+            if exception is not None
+        ),
+        None,
+    )
+    source = (result.function.source_code if result.function else None) or ""
+
+    return {
+        "time": round(time.time(), 3),
+        "session": SESSION_ID,
+        "module": module_name,
+        "function": result.function.name if result.function else None,
+        "status": result.status.name if result.status else None,
+        "outcomes": dict(outcomes),
+        "passed": result.status == IPytestOutcome.FINISHED
+        and bool(tests)
+        and outcomes.get(TestOutcome.PASS.name, 0) == len(tests),
+        "duration": round(sum(test.duration or 0.0 for test in tests), 6),
+        "attempts": result.test_attempts,
+        "cached": result.cached,
+        "failure": failure,
+        "source_hash": hashlib.sha256(source.encode("utf-8")).hexdigest()[:16],
+    }
+
+
+class TelemetryWriter:
+    """Append records to a JSONL file from a background thread, rotating it when too large"""
+
+    # Records waiting to be written: beyond that, new records are dropped
+    MAX_PENDING = 10_000
+    # Seconds between two writes, to batch the records
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = DEFAULT_BACKUPS,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue: Queue[dict[str, Any] | None] = Queue(maxsize=self.MAX_PENDING)
+        self._thread = threading.Thread(
+            target=self._run, name="ipytest-telemetry", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Queue a record, or drop it if the writer cannot keep up"""
+        try:
+            self._queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Write the pending records and stop the background thread"""
+        try:
+            self._queue.put(None, timeout=self.FLUSH_INTERVAL)
+        except Full:
+            return
+        self._thread.join(timeout=5 * self.FLUSH_INTERVAL)
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.FLUSH_INTERVAL))
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+
+            if None in batch:
+                stopped = True
+            lines = "".join(
+                json.dumps(record, separators=(",", ":")) + "\n"
+                for record in batch
+                if record is not None
+            )
+            if lines:
+                try:
+                    self._append(lines)
+                except OSError:
+                    self.dropped += len(batch)
+
+    def _append(self, lines: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Several kernels may share the file: only one of them may rotate it at a time
+        with self._locked():
+            if self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+                self._rotate()
+            with self.path.open("a", encoding="utf-8") as file:
+                file.write(lines)
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold an exclusive lock on `file.lock`, shared by all the processes writing to `file`"""
+        if fcntl is None:
+            yield
+            return
+
+        with self.path.with_name(f"{self.path.name}.lock").open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rotate(self) -> None:
+        """Rename `file` to `file.1`, `file.1` to `file.2`, and so on"""
+        for i in range(self.backups - 1, 0, -1):
+            backup = self.path.with_name(f"{self.path.name}.{i}")
+            if backup.exists():
+                backup.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+
+_writer: TelemetryWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_telemetry_writer() -> TelemetryWriter | None:
+    """Return the per-kernel writer, or `None` if telemetry is disabled"""
+    global _writer
+
+    if not (path := os.getenv("IPYTEST_TELEMETRY_FILE")):
+        return None
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = TelemetryWriter(
+                pathlib.Path(path),
+                max_bytes=int(
+                    os.getenv("IPYTEST_TELEMETRY_MAX_BYTES", DEFAULT_MAX_BYTES)
+                ),
+            )
+            atexit.register(_writer.close)
+
+    return _writer
+
+
+def record_result(module_name: str, result: IPytestResult) -> None:
+    """Record a test run, if telemetry is enabled. Never raises"""
+    try:
+        if (writer := get_telemetry_writer()) is not None:
+            writer.write(result_record(module_name, result))
+    except Exception:
+        pass
+
+
+def read_records(paths: list[pathlib.Path]) -> list[dict[str, Any]]:
+    """Read the records of JSONL files, skipping the lines that cannot be parsed"""
+    records = []
+    for path in paths:
+        with path.open(encoding="utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def summarize(records: list[dict[str, Any]], top: int = 3) -> list[dict[str, Any]]:
+    """Aggregate the records by exercise: attempts, time to first pass, common failures"""
+    by_exercise: dict[tuple[str, str], list[dict[str, Any]]] = collections.defaultdict(
+        list
+    )
+    for record in records:
+        if record.get("function"):
+            by_exercise[(record["module"], record["function"])].append(record)
+
+    summary = []
+    for (module, function), runs in sorted(by_exercise.items()):
+        runs.sort(key=lambda record: record["time"])
+
+        # Per kernel session: time and number of runs until the first pass
+        sessions: dict[str, list[dict[str, Any]]] = collections.defaultdict(list)
+        for record in runs:
+            sessions[record["session"]].append(record)
+
+        times_to_pass, runs_to_pass = [], []
+        for session_runs in sessions.values():
+            for i, record in enumerate(session_runs):
+                if record["passed"]:
+                    times_to_pass.append(record["time"] - session_runs[0]["time"])
+                    runs_to_pass.append(i + 1)
+                    break
+
+        failures = collections.Counter(
+            record["failure"] for record in runs if record.get("failure")
+        )
+
+        summary.append(
+            {
+                "module": module,
+                "function": function,
+                "runs": len(runs),
+                "sessions": len(sessions),
+                "passed_sessions": len(runs_to_pass),
+                "median_runs_to_pass": _median(runs_to_pass),
+                "median_seconds_to_pass": _median(times_to_pass),
+                "common_failures": failures.most_common(top),
+            }
+        )
+
+    return summary
+
+
+def _median(values: list[float]) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The arguments of the `telemetry` command"""
+    parser.add_argument("files", nargs="+", type=pathlib.Path, help="JSONL files")
+    parser.add_argument(
+        "--json", action="store_true", help="print the summary as JSON lines"
+    )
+    parser.add_argument(
+        "--top", type=int, default=3, help="number of common failures to show"
+    )
+
+
+def main(args: argparse.Namespace) -> int:
+    """Print the summary of telemetry files"""
+    summary = summarize(read_records(args.files), top=args.top)
+
+    if args.json:
+        for row in summary:
+            print(json.dumps(row))
+        return 0
+
+    for row in summary:
+        seconds = row["median_seconds_to_pass"]
+        failures = ", ".join(
+            f"{name} ({count})" for name, count in row["common_failures"]
+        )
+        print(
+            f"{row['module']}::{row['function']}: {row['runs']} runs, "
+            f"{row['passed_sessions']}/{row['sessions']} sessions passed"
+            + (
+                f", median {row['median_runs_to_pass']} runs"
+                f" and {seconds:.0f} s to pass"
+                if seconds is not None
+                else ""
+            )
+            + (f", failures: {failures}" if failures else "")
+        )
+    return 0
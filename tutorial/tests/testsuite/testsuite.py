@@ -2,12 +2,15 @@
 
 import ast
 import dataclasses
+import functools
+import html
 import inspect
-import io
 import os
 import pathlib
 from collections import defaultdict
-from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from queue import Queue
 from threading import Thread
 
@@ -19,44 +22,56 @@ from IPython.core.magic import Magics, cell_magic, magics_class
 from IPython.display import HTML, display
 
 from .ai_helpers import OpenAIWrapper
-from .ast_parser import AstParser
+from .ast_parser import get_solution_code
+from .capture import CapturedOutput
 from .exceptions import (
     FunctionNotFoundError,
+    GlobalNotSendableError,
     InstanceNotFoundError,
-    OpenAIWrapperError,
     PytestInternalError,
     TestModuleNotFoundError,
+    UnknownLimitError,
+    ValidationResult,
 )
 from .helpers import (
+    ATTEMPT_STATUSES,
     AFunction,
     DebugOutput,
-    FunctionInjectionPlugin,
     IPytestOutcome,
     IPytestResult,
     ResultCollector,
+    RunOptions,
+    StreamingTestOutput,
+    TestCaseResult,
     TestOutcome,
     TestResultOutput,
 )
+from .limits import ResourceLimits
+from .llm_backends import backend_from_env
+from .result_cache import result_cache, result_cache_key
+from .session import get_test_session
+from .telemetry import record_result
+from .validation_cache import get_validation_cache, validation_key
+from .workers import KernelGlobals, get_worker_pool, kernel_globals
 
 
 def run_pytest_for_function(
-    module_file: pathlib.Path, function: AFunction
+    module_file: pathlib.Path,
+    function: AFunction,
+    on_result: Callable[[TestCaseResult], None] | None = None,
+    options: RunOptions | None = None,
 ) -> IPytestResult:
     """
-    Runs pytest for a single function and returns an `IPytestResult` object
+    Runs pytest for a single function and returns an `IPytestResult` object.
+    The test module is collected once per kernel and reused until it changes.
+    If given, `on_result` is called with each test result as soon as it is available.
     """
-    with redirect_stdout(io.StringIO()) as _, redirect_stderr(io.StringIO()) as _:
-        # Create the test collector
-        result_collector = ResultCollector()
-
-        # Run the tests
-        result = pytest.main(
-            ["-k", f"test_{function.name}", f"{module_file}"],
-            plugins=[
-                FunctionInjectionPlugin(function.implementation),
-                result_collector,
-            ],
+    try:
+        result, result_collector = get_test_session(module_file).run(
+            function.name, function.implementation, on_result, options
         )
+    except Exception:
+        result, result_collector = pytest.ExitCode.INTERNAL_ERROR, ResultCollector()
 
     match result:
         case pytest.ExitCode.OK:
@@ -66,6 +81,19 @@ def run_pytest_for_function(
                 test_results=list(result_collector.tests.values()),
             )
         case pytest.ExitCode.TESTS_FAILED:
+            for outcome, status in (
+                (TestOutcome.TIMEOUT, IPytestOutcome.TIMEOUT),
+                (TestOutcome.RESOURCE_LIMIT, IPytestOutcome.RESOURCE_LIMIT),
+            ):
+                if any(
+                    test.outcome == outcome for test in result_collector.tests.values()
+                ):
+                    return IPytestResult(
+                        function=function,
+                        status=status,
+                        test_results=list(result_collector.tests.values()),
+                    )
+
             if any(
                 test.outcome == TestOutcome.TEST_ERROR
                 for test in result_collector.tests.values()
@@ -107,9 +135,10 @@ def run_pytest_in_background(
     module_file: pathlib.Path,
     function: AFunction,
     test_queue: Queue,
+    options: RunOptions | None = None,
 ):
     """Runs pytest in a background thread and puts the result in the provided queue"""
-    test_queue.put(run_pytest_for_function(module_file, function))
+    test_queue.put(run_pytest_for_function(module_file, function, options=options))
 
 
 def _name_from_line(line: str = ""):
@@ -153,10 +182,20 @@ class TestMagic(Magics):
         self.module_file: pathlib.Path | None = None
         self.module_name: str | None = None
         self.threaded: bool | None = None
+        self.isolated: bool | None = None
+        self.parallel: bool | None = None
+        self.failed_first: bool | None = None
+        self.options: RunOptions = RunOptions()
+        # Names of the tests that failed in the last run, by module and function
+        self.failed_tests: dict[str, dict[str, set[str]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
         self.test_queue: Queue[IPytestResult] | None = None
         self.cell_execution_count: dict[str, dict[str, int]] = defaultdict(
             lambda: defaultdict(int)
         )
+        # The outputs saved to files by the last run of each cell
+        self.cell_outputs: dict[str, list[CapturedOutput]] = defaultdict(list)
         self._orig_traceback = self.shell._showtraceback  # type: ignore
         # This is monkey-patching suppress printing any exception or traceback
 
@@ -181,16 +220,85 @@ class TestMagic(Magics):
             and (callable(function) or inspect.iscoroutinefunction(function))
         ]
 
-    def run_test_with_tracking(self, function: AFunction) -> IPytestResult:
-        """Runs tests for a function while tracking execution count and handling threading"""
+    @property
+    def cell_id(self) -> str:
+        """The ID of the cell being executed"""
+        return str(self.shell.parent_header["metadata"]["cellId"])  # type: ignore
+
+    def worker_globals(self) -> KernelGlobals | None:
+        """The globals of the kernel that the cell uses, or `None` if a worker cannot rebuild them"""
+        try:
+            return kernel_globals(self.cell, self.shell.user_ns)
+        except GlobalNotSendableError:
+            return None
+
+    def run_options(self, function: AFunction) -> RunOptions:
+        """The options of the run, with the failed tests of the function if needed"""
+        if not self.failed_first:
+            return self.options
+        return dataclasses.replace(
+            self.options,
+            failed_first=frozenset(
+                self.failed_tests[str(self.module_name)][function.name]
+            ),
+        )
+
+    def cache_options(self) -> tuple[str, ...]:
+        """The options that change which tests run, and so their cached results"""
+        return tuple(
+            name
+            for name, enabled in (
+                ("failfast", self.options.failfast),
+                ("tracemalloc", self.options.trace_memory),
+                ("profile", self.options.profile),
+            )
+            if enabled
+        )
+
+    def track_failures(self, function: AFunction, result: IPytestResult) -> None:
+        """Remember which tests of a function failed, for the `ff` option"""
+        failed = self.failed_tests[str(self.module_name)][function.name]
+        for test in result.test_results or []:
+            if test.outcome == TestOutcome.PASS:
+                failed.discard(test.test_name)
+            else:
+                failed.add(test.test_name)
+
+    def run_test_with_tracking(
+        self, function: AFunction, worker_globals: KernelGlobals | None = None
+    ) -> IPytestResult:
+        """
+        Runs tests for a function while tracking execution count and handling threading.
+        With `worker_globals`, the tests run in a worker process that rebuilds them.
+        """
         assert isinstance(self.module_file, pathlib.Path)
 
         # Store execution count information for each cell
-        cell_id = str(self.shell.parent_header["metadata"]["cellId"])  # type: ignore
+        cell_id = self.cell_id
         self.cell_execution_count[cell_id][function.name] += 1
 
-        # Run the tests on a separate thread
-        if self.threaded:
+        # Reuse the results of the same solution against the same tests
+        cache_key = result_cache_key(self.module_file, function, *self.cache_options())
+        if (
+            cache_key is not None
+            and (result := result_cache.get(cache_key)) is not None
+        ):
+            return dataclasses.replace(
+                result,
+                function=function,
+                test_attempts=self.cell_execution_count[cell_id][function.name],
+            )
+
+        # Run the tests in a worker process, or on a separate thread
+        if worker_globals is not None:
+            result = get_worker_pool().run(
+                self.module_file,
+                function,
+                cell_content=self.cell,
+                kernel_globals=worker_globals,
+                options=self.run_options(function),
+            )
+        elif self.threaded:
             assert isinstance(self.test_queue, Queue)
             thread = Thread(
                 target=run_pytest_in_background,
@@ -198,16 +306,29 @@ class TestMagic(Magics):
                     self.module_file,
                     function,
                     self.test_queue,
+                    self.run_options(function),
                 ),
             )
             thread.start()
             thread.join()
             result = self.test_queue.get()
         else:
-            result = run_pytest_for_function(self.module_file, function)
+            result = run_pytest_for_function(
+                self.module_file, function, options=self.run_options(function)
+            )
 
         match result.status:
             case IPytestOutcome.FINISHED:
+                if cache_key is not None:
+                    result_cache.put(cache_key, result)
+                self.track_failures(function, result)
+                return dataclasses.replace(
+                    result,
+                    test_attempts=self.cell_execution_count[cell_id][function.name],
+                )
+            case IPytestOutcome.TIMEOUT | IPytestOutcome.RESOURCE_LIMIT:
+                # A failed attempt too, but not cached: the machine may be less busy next time
+                self.track_failures(function, result)
                 return dataclasses.replace(
                     result,
                     test_attempts=self.cell_execution_count[cell_id][function.name],
@@ -215,19 +336,31 @@ class TestMagic(Magics):
             case _:
                 return result
 
-    def run_cell(self) -> list[IPytestResult]:
-        """Evaluates the cell via IPython and runs tests for the functions"""
+    def remove_previous_outputs(self) -> None:
+        """Delete the full outputs of the previous run of the cell, unless cached results still show them"""
+        cached = result_cache.spill_files()
+        for output in self.cell_outputs.pop(self.cell_id, []):
+            if output.spill_file not in cached:
+                output.remove()
+
+    def evaluate_cell(self) -> IPytestResult | None:
+        """Evaluates the cell via IPython and returns a result only if that failed"""
         try:
             result = self.shell.run_cell(self.cell, silent=True)  # type: ignore
             result.raise_error()
         except Exception as err:
-            return [
-                IPytestResult(
-                    status=IPytestOutcome.COMPILE_ERROR,
-                    exceptions=[err],
-                    cell_content=self.cell,
-                )
-            ]
+            return IPytestResult(
+                status=IPytestOutcome.COMPILE_ERROR,
+                exceptions=[err],
+                cell_content=self.cell,
+            )
+
+        return None
+
+    def run_cell(self) -> list[IPytestResult]:
+        """Evaluates the cell via IPython and runs tests for the functions"""
+        if (error := self.evaluate_cell()) is not None:
+            return [error]
 
         functions_to_run = self.extract_functions_to_test()
 
@@ -239,13 +372,130 @@ class TestMagic(Magics):
                 )
             ]
 
-        # Run the tests for each function
-        test_results = [
-            self.run_test_with_tracking(function) for function in functions_to_run
-        ]
+        # Tests that use what a worker cannot rebuild run in the kernel instead
+        worker_globals = (
+            self.worker_globals() if self.isolated or self.parallel else None
+        )
+        run_test = functools.partial(
+            self.run_test_with_tracking, worker_globals=worker_globals
+        )
+
+        # Run the tests for each function, concurrently only in the workers
+        if self.parallel and worker_globals is not None and len(functions_to_run) > 1:
+            # Create the cell's counters before the threads increment them
+            _ = self.cell_execution_count[self.cell_id]
+            # Each thread waits on a worker process, and `map` keeps the order
+            with ThreadPoolExecutor(max_workers=len(functions_to_run)) as executor:
+                test_results = list(executor.map(run_test, functions_to_run))
+        else:
+            test_results = [run_test(function) for function in functions_to_run]
 
         return test_results
 
+    def stream_cell(self) -> None:
+        """
+        Evaluates the cell via IPython and tests its functions in the background.
+        Each test result is displayed as soon as it arrives, and the kernel stays free.
+        """
+        assert isinstance(self.module_file, pathlib.Path)
+
+        if (error := self.evaluate_cell()) is not None:
+            TestResultOutput(error, None, self.shell.openai_client).display_results()  # type: ignore
+            return
+
+        if not (functions_to_run := self.extract_functions_to_test()):
+            TestResultOutput(
+                IPytestResult(
+                    status=IPytestOutcome.SOLUTION_FUNCTION_MISSING,
+                    exceptions=[FunctionNotFoundError()],
+                ),
+                None,
+                self.shell.openai_client,  # type: ignore
+            ).display_results()
+            return
+
+        # Another cell may run before the tests finish: capture everything now
+        module_file, module_name, cell = (
+            self.module_file,
+            str(self.module_name),
+            self.cell,
+        )
+        run_options = {
+            function.name: self.run_options(function) for function in functions_to_run
+        }
+        cache_keys = {
+            function.name: result_cache_key(
+                module_file, function, *self.cache_options()
+            )
+            for function in functions_to_run
+        }
+        worker_globals = self.worker_globals()
+        openai_client = self.shell.openai_client  # type: ignore
+        cell_counts = self.cell_execution_count[self.cell_id]
+        cell_outputs = self.cell_outputs[self.cell_id]
+
+        def run_tests(
+            function: AFunction, output: StreamingTestOutput, attempts: int
+        ) -> None:
+            solution: Callable[[], str] | None = None
+            try:
+                cache_key = cache_keys[function.name]
+                if (
+                    cache_key is not None
+                    and (result := result_cache.get(cache_key)) is not None
+                ):
+                    result = dataclasses.replace(result, function=function)
+                else:
+                    if worker_globals is None:
+                        result = run_pytest_for_function(
+                            module_file,
+                            function,
+                            output.add,
+                            run_options[function.name],
+                        )
+                    else:
+                        result = get_worker_pool().run(
+                            module_file,
+                            function,
+                            cell_content=cell,
+                            kernel_globals=worker_globals,
+                            on_result=output.add,
+                            options=run_options[function.name],
+                        )
+                    if result.status == IPytestOutcome.FINISHED and cache_key:
+                        result_cache.put(cache_key, result)
+                    if result.status in ATTEMPT_STATUSES:
+                        self.track_failures(function, result)
+                if result.status in ATTEMPT_STATUSES:
+                    result = dataclasses.replace(result, test_attempts=attempts)
+                    solution = functools.partial(
+                        get_solution_code, module_file, function.name
+                    )
+            except Exception as err:
+                result = IPytestResult(
+                    function=function,
+                    status=IPytestOutcome.UNKNOWN_ERROR,
+                    exceptions=[err],
+                )
+            record_result(module_name, result)
+            cell_outputs.extend(result.spilled_outputs())
+            output.finish(TestResultOutput(result, solution, openai_client))
+
+        for function in functions_to_run:
+            cell_counts[function.name] += 1
+            output = StreamingTestOutput(function)
+            display(output.widget)
+            if worker_globals is None:
+                # A worker cannot rebuild what the cell uses: the kernel runs the tests,
+                # and the results still appear one by one
+                run_tests(function, output, cell_counts[function.name])
+                continue
+            Thread(
+                target=run_tests,
+                args=(function, output, cell_counts[function.name]),
+                daemon=True,
+            ).start()
+
     @contextmanager
     def traceback_handling(self, debug: bool):
         """Context manager to temporarily modify traceback behavior"""
@@ -274,12 +524,66 @@ class TestMagic(Magics):
             line_contents.remove("debug")
 
         # Check if we need to run the tests on a separate thread
-        if "async" in line_contents:
+        self.threaded = "async" in line_contents
+        if self.threaded:
             line_contents.remove("async")
-            self.threaded = True
             self.test_queue = Queue()
 
+        # Check if we need to run the tests in a worker process
+        self.isolated = "isolated" in line_contents
+        if self.isolated:
+            line_contents.remove("isolated")
+
+        # Check if we need to test all the functions concurrently, in worker processes
+        self.parallel = "parallel" in line_contents
+        if self.parallel:
+            line_contents.remove("parallel")
+
+        # Resource limits of each test, e.g., `timeout=10 cputime=5 memory=512`
+        limit_options = {option for option in line_contents if "=" in option}
+        line_contents -= limit_options
+
+        # Stop after the first failure? Run the tests that failed last time first?
+        failfast = "failfast" in line_contents
+        line_contents.discard("failfast")
+        self.failed_first = "ff" in line_contents
+        line_contents.discard("ff")
+
+        # Measure the peak memory allocated by the solution in each test?
+        trace_memory = "tracemalloc" in line_contents
+        line_contents.discard("tracemalloc")
+
+        # Profile the solution and show where it spends its time?
+        profile = "profile" in line_contents
+        line_contents.discard("profile")
+
+        # Check if we need to stream the results while the tests run in the background
+        stream = "stream" in line_contents
+        if stream:
+            line_contents.remove("stream")
+
         with self.traceback_handling(debug):
+            try:
+                limits = ResourceLimits.from_env().with_options(
+                    dict(option.split("=", 1) for option in limit_options)
+                )
+            except (UnknownLimitError, ValueError) as err:
+                display(
+                    _status_html(
+                        "🚫 <strong style='color: red;'>Invalid resource limit:</strong>"
+                        f"<br>{html.escape(str(err))}",
+                        "#ffebee",  # Red
+                    )
+                )
+                return
+
+            self.options = RunOptions(
+                limits=limits,
+                failfast=failfast,
+                trace_memory=trace_memory,
+                profile=profile,
+            )
+
             # Get the module containing the test(s)
             if (
                 module_name := get_module_name(
@@ -300,9 +604,20 @@ class TestMagic(Magics):
 
             self.module_file = module_file
 
+            self.remove_previous_outputs()
+
+            # Stream the results, without blocking the kernel
+            if stream:
+                self.stream_cell()
+                return
+
             # Run the cell
             results = self.run_cell()
 
+            for result in results:
+                record_result(self.module_name, result)
+                self.cell_outputs[self.cell_id].extend(result.spilled_outputs())
+
             # If in debug mode, display debug information first
             if debug:
                 debug_output = DebugOutput(
@@ -312,12 +627,13 @@ class TestMagic(Magics):
                 )
                 display(HTML(debug_output.to_html()))
 
-            # Parse the AST of the test module to retrieve the solution code
-            ast_parser = AstParser(self.module_file)
-            # Display the test results and the solution code
+            # Display the test results and the solution code,
+            # which is retrieved from the test module only if the student wants to see it
             for result in results:
                 solution = (
-                    ast_parser.get_solution_code(result.function.name)
+                    functools.partial(
+                        get_solution_code, self.module_file, result.function.name
+                    )
                     if result.function and result.function.name
                     else None
                 )
@@ -328,11 +644,19 @@ class TestMagic(Magics):
                 ).display_results()
 
 
-def load_ipython_extension(ipython):
+def _status_html(message: str, color: str) -> HTML:
+    return HTML(
+        f"<div style='background-color: {color}; border-radius: 5px; padding: 10px;'>"
+        f"{message}"
+        "</div>"
+    )
+
+
+def configure_ai_explanations(ipython) -> None:
     """
-    Any module file that define a function named `load_ipython_extension`
-    can be loaded via `%load_ext module.path` or be configured to be
-    autoloaded by IPython at startup time.
+    Configure the client of the AI explanations without waiting for the network.
+    A configuration validated recently is trusted, otherwise it is validated in the background:
+    explanations requested in the meantime wait for the validation.
     """
     # Configure the API key for the OpenAI client
     openai_env = find_dotenv("openai.env")
@@ -343,49 +667,57 @@ def load_ipython_extension(ipython):
     model = os.getenv("OPENAI_MODEL")
     language = os.getenv("OPENAI_LANGUAGE")
 
-    # First, validate the key
-    key_validation = OpenAIWrapper.validate_api_key(api_key)
-    if not key_validation.is_valid:
-        message = key_validation.user_message
-        message_color = "#ffebee"  # Red
+    try:
+        backend = backend_from_env(api_key)
+        openai_client = OpenAIWrapper.create(api_key, model, language, backend)
+    except Exception as e:
         ipython.openai_client = None
-    else:
-        assert api_key is not None  # must be so at this point
-        try:
-            openai_client, model_validation = OpenAIWrapper.create_validated(
-                api_key, model, language
-            )
-
-            if model_validation.is_valid:
-                ipython.openai_client = openai_client
-                message_color = "#d9ead3"  # Green
-            else:
-                message_color = "#ffebee"  # Red
-                ipython.openai_client = None
-
-            message = model_validation.user_message
-        except OpenAIWrapperError as e:
-            ipython.openai_client = None
-            message = f"🚫 <strong style='color: red;'>OpenAI configuration error:</strong><br>{str(e)}"
-            message_color = "#ffebee"
-        except Exception as e:
-            # Handle any other unexpected errors
-            ipython.openai_client = None
-            message = (
-                f"🚫 <strong style='color: red;'>Unexpected error:</strong><br>{str(e)}"
+        display(
+            _status_html(
+                f"🚫 <strong style='color: red;'>Unexpected error:</strong><br>{str(e)}",
+                "#ffebee",  # Red
             )
-            message_color = "#ffebee"
-
-    display(
-        HTML(
-            "<div style='background-color: "
-            f"{message_color}; border-radius: 5px; padding: 10px;'>"
-            f"{message}"
-            "</div>"
         )
+        return
+
+    cache = get_validation_cache()
+    key = validation_key(backend, api_key, model)
+
+    if (validated_model := cache.get(key)) is not None:
+        openai_client.model = model or validated_model
+        ipython.openai_client = openai_client
+        message = ValidationResult(is_valid=True).user_message
+        display(_status_html(message, "#d9ead3"))  # Green
+        return
+
+    ipython.openai_client = openai_client
+    status = display(
+        _status_html(
+            "⏳ <strong>Checking the OpenAI configuration...</strong>", "#f5f5f5"
+        ),
+        display_id=True,
     )
 
-    # Register the magic
+    def on_validated(validation: ValidationResult) -> None:
+        if validation.is_valid:
+            cache.put(key, openai_client.model)
+            color = "#d9ead3"  # Green
+        else:
+            ipython.openai_client = None
+            color = "#ffebee"  # Red
+        if status is not None:
+            status.update(_status_html(validation.user_message, color))
+
+    openai_client.validate_in_background(on_validated)
+
+
+def load_ipython_extension(ipython):
+    """
+    Any module file that define a function named `load_ipython_extension`
+    can be loaded via `%load_ext module.path` or be configured to be
+    autoloaded by IPython at startup time.
+    """
+    # Register the magic first: it does not depend on the AI explanations
     ipython.register_magics(TestMagic)
 
     message = (
@@ -393,3 +725,5 @@ def load_ipython_extension(ipython):
         "🔄 <strong>IPytest extension (re)loaded.</strong></div>"
     )
     display(HTML(message))
+
+    configure_ai_explanations(ipython)
@@ -0,0 +1,88 @@
+"""
+A module to remember the AI configurations that were validated, across kernel restarts.
+
+Validating an API key takes a network round-trip: a valid configuration is trusted
+for `IPYTEST_VALIDATION_TTL` seconds instead. Only a digest of the key is stored.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import Any
+
+from .explanation_cache import cache_directory
+from .llm_backends import ChatBackend
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def validation_key(backend: ChatBackend, api_key: str | None, model: str | None) -> str:
+    """Identifies a configuration: the backend and its endpoint, the key, and the model"""
+    return hashlib.sha256(
+        json.dumps(
+            [
+                type(backend).__name__,
+                getattr(backend, "base_url", None),
+                api_key,
+                model,
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class ValidationCache:
+    """A JSON file of the validated configurations, and the model each one resolved to"""
+
+    def __init__(self, path: pathlib.Path, ttl: float = DEFAULT_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict[str, dict[str, Any]]:
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, key: str) -> str | None:
+        """The model of a configuration validated less than `ttl` seconds ago, or `None`"""
+        with self._lock:
+            entry = self._read().get(key)
+        if not isinstance(entry, dict) or time.time() - entry.get("time", 0) > self.ttl:
+            return None
+        return entry.get("model")
+
+    def put(self, key: str, model: str) -> None:
+        """Remember a valid configuration. Never raises"""
+        with self._lock:
+            now = time.time()
+            entries = {
+                name: entry
+                for name, entry in self._read().items()
+                if isinstance(entry, dict) and now - entry.get("time", 0) <= self.ttl
+            }
+            entries[key] = {"model": model, "time": now}
+
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Written next to the file and renamed, so that other kernels never read half of it
+                with tempfile.NamedTemporaryFile(
+                    "w", dir=self.path.parent, delete=False, encoding="utf-8"
+                ) as file:
+                    json.dump(entries, file)
+                os.replace(file.name, self.path)
+            except OSError:
+                pass
+
+
+def get_validation_cache() -> ValidationCache:
+    """The validation cache, configured with `IPYTEST_VALIDATION_TTL`, in seconds"""
+    return ValidationCache(
+        cache_directory() / "validations.json",
+        ttl=float(os.getenv("IPYTEST_VALIDATION_TTL", DEFAULT_TTL)),
+    )
@@ -0,0 +1,508 @@
+"""A module to run the tests in a pool of warm worker processes"""
+
+import ast
+import dataclasses
+import importlib
+import inspect
+import io
+import linecache
+import multiprocessing
+import os
+import pathlib
+import pickle
+import textwrap
+import threading
+from collections.abc import Callable
+from multiprocessing.connection import Connection
+from queue import Empty, Queue
+from types import CodeType, ModuleType
+
+from .capture import output_directory
+from .exceptions import (
+    GlobalNotSendableError,
+    TestTimeoutError,
+    WorkerCrashedError,
+    rebuild_remote_error,
+)
+from .helpers import (
+    AFunction,
+    IPytestOutcome,
+    IPytestResult,
+    RunOptions,
+    TestCaseResult,
+)
+from .limits import address_space_limit
+from .session import get_test_session
+
+# Heavy test dependencies that every worker should already have imported
+PRELOAD_MODULES = ("numpy", "pandas", "sklearn", "cv2", "torch")
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def process_context(
+    preload: tuple[str, ...] | list[str],
+) -> multiprocessing.context.BaseContext:
+    """
+    The context to start the test processes with.
+    A forkserver imports the preloaded modules once, and every process
+    forked from it starts with them already imported.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(list(preload))
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+@dataclasses.dataclass
+class KernelGlobals:
+    """The globals of the kernel that a cell uses, in a form a worker can rebuild"""
+
+    # The modules by their alias, e.g., `np` for `numpy`
+    modules: dict[str, str] = dataclasses.field(default_factory=dict)
+    # The source of the functions and classes defined in other cells, dependencies first
+    definitions: list[str] = dataclasses.field(default_factory=list)
+    # The other values, pickled
+    values: dict[str, bytes] = dataclasses.field(default_factory=dict)
+
+
+class _KernelPickler(pickle.Pickler):
+    """A pickler that records the functions and classes of `__main__` a value refers to"""
+
+    def __init__(self, file: io.BytesIO) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.main_names: set[str] = set()
+
+    def reducer_override(self, obj):
+        if (inspect.isclass(obj) or inspect.isfunction(obj)) and getattr(
+            obj, "__module__", None
+        ) == "__main__":
+            self.main_names.add(obj.__qualname__.split(".")[0])
+        return NotImplemented
+
+
+class _NamespaceUnpickler(pickle.Unpickler):
+    """An unpickler that finds the functions and classes of `__main__` in a namespace"""
+
+    def __init__(self, file: io.BytesIO, namespace: dict) -> None:
+        super().__init__(file)
+        self.namespace = namespace
+
+    def find_class(self, module: str, name: str):
+        if module == "__main__":
+            return self.namespace[name]
+        return super().find_class(module, name)
+
+
+def _referenced_names(source_code: str) -> list[str]:
+    """The global names that some code uses, in all its nested scopes"""
+    names: list[str] = []
+    codes = [compile(source_code, "<ipytest-cell>", "exec")]
+    while codes:
+        code = codes.pop()
+        names.extend(code.co_names)
+        codes.extend(const for const in code.co_consts if isinstance(const, CodeType))
+    return names
+
+
+def _bound_names(source_code: str) -> set[str]:
+    """The global names that the top-level statements of some code bind"""
+    names: set[str] = set()
+    for node in ast.parse(source_code).body:
+        if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+            names.add(node.name)
+        elif isinstance(node, ast.Import | ast.ImportFrom):
+            names.update(
+                (alias.asname or alias.name).split(".")[0] for alias in node.names
+            )
+        else:
+            names.update(
+                child.id
+                for child in ast.walk(node)
+                if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store)
+            )
+    return names
+
+
+def _defined_in_kernel(value: object) -> bool:
+    """Whether a value is a function or a class defined in a cell"""
+    try:
+        value = inspect.unwrap(value) if callable(value) else value
+    except ValueError:
+        return False
+    return (inspect.isclass(value) or inspect.isfunction(value)) and getattr(
+        value, "__module__", None
+    ) == "__main__"
+
+
+def _source(value: object) -> str | None:
+    """The source of a function or a class defined in a cell, if it can be found"""
+    if not inspect.isclass(value):
+        return textwrap.dedent(inspect.getsource(value))  # type: ignore[arg-type]
+
+    # `inspect` looks for the source of a class in its module's file, but cells have none:
+    # look for it where its methods were defined instead
+    for member in vars(value).values():
+        function = inspect.unwrap(getattr(member, "__func__", member))
+        if not inspect.isfunction(function):
+            continue
+        code = function.__code__
+        lines = linecache.getlines(code.co_filename)
+        for node in ast.walk(ast.parse("".join(lines))):
+            if (
+                isinstance(node, ast.ClassDef)
+                and node.name == value.__name__
+                and node.lineno <= code.co_firstlineno <= (node.end_lineno or 0)
+            ):
+                start = min(
+                    [node.lineno] + [deco.lineno for deco in node.decorator_list]
+                )
+                return textwrap.dedent("".join(lines[start - 1 : node.end_lineno]))
+
+    return None
+
+
+def kernel_globals(source_code: str, namespace: dict) -> KernelGlobals:
+    """
+    Collect the globals that a cell uses but does not define, e.g., a helper function
+    of another cell or a name imported with `from ... import ...`.
+    Raises `GlobalNotSendableError` if one of them cannot be rebuilt in a worker.
+    """
+    result = KernelGlobals(modules=imported_modules(namespace))
+    visited: set[str] = set()
+
+    def visit_source(name: str, source: str, bound: set[str]) -> None:
+        try:
+            names = _referenced_names(source)
+        except SyntaxError as err:
+            raise GlobalNotSendableError(name) from err
+        for referenced in names:
+            if referenced not in bound:
+                visit(referenced)
+
+    def visit(name: str) -> None:
+        # Dunder names, e.g., `__name__` in a class body, belong to the worker
+        if name in visited or name not in namespace or name.startswith("__"):
+            return
+        visited.add(name)
+        value = namespace[name]
+
+        if isinstance(value, ModuleType):
+            result.modules[name] = value.__name__
+        elif _defined_in_kernel(value):
+            # Pickle would only send a reference to `__main__`: send the source instead
+            if getattr(value, "__name__", None) != name:
+                raise GlobalNotSendableError(name)
+            try:
+                source = _source(value)
+            except (OSError, TypeError, SyntaxError) as err:
+                raise GlobalNotSendableError(name) from err
+            if source is None:
+                raise GlobalNotSendableError(name)
+            visit_source(name, source, {name})
+            result.definitions.append(source)
+        else:
+            buffer = io.BytesIO()
+            pickler = _KernelPickler(buffer)
+            try:
+                pickler.dump(value)
+            except Exception as err:
+                raise GlobalNotSendableError(name) from err
+            for main_name in pickler.main_names:
+                visit(main_name)
+            result.values[name] = buffer.getvalue()
+
+    try:
+        bound = _bound_names(source_code)
+    except SyntaxError as err:
+        # E.g., a cell with IPython magics, which only the kernel can run
+        raise GlobalNotSendableError("<cell>") from err
+    visit_source("<cell>", source_code, bound)
+    return result
+
+
+@dataclasses.dataclass
+class WorkerRequest:
+    """Everything a worker needs to test a solution function"""
+
+    module_file: pathlib.Path
+    function_name: str
+    source_code: str
+    kernel_globals: KernelGlobals
+    cwd: str
+    stream: bool = False
+    options: RunOptions = dataclasses.field(default_factory=RunOptions)
+
+
+def _picklable_exception(exc: BaseException) -> BaseException:
+    """Return `exc` if it can be sent back to the kernel, or a stand-in otherwise"""
+    try:
+        # Exceptions with a custom `__init__` may be pickled but not unpickled
+        pickle.loads(pickle.dumps(exc))
+    except Exception:
+        return rebuild_remote_error(type(exc).__name__, str(exc))
+    return exc
+
+
+def _picklable_test(test: TestCaseResult) -> TestCaseResult:
+    """Strip the parts of a test result that cannot cross a process boundary"""
+    return dataclasses.replace(
+        test,
+        # The frames stay in the worker: format the traceback while they are there
+        formatted_exception=test.format_exception(),
+        exception=_picklable_exception(test.exception)
+        if test.exception is not None
+        else None,
+        traceback=None,
+    )
+
+
+def make_picklable(result: IPytestResult) -> IPytestResult:
+    """Strip the parts of a result that cannot cross a process boundary"""
+    return dataclasses.replace(
+        result,
+        function=None,
+        test_results=[_picklable_test(test) for test in result.test_results]
+        if result.test_results is not None
+        else None,
+        exceptions=[_picklable_exception(exc) for exc in result.exceptions]
+        if result.exceptions is not None
+        else None,
+    )
+
+
+def _execute_request(
+    request: WorkerRequest,
+    on_result: Callable[[TestCaseResult], None] | None = None,
+    on_deadline: Callable[[float | None], None] | None = None,
+) -> IPytestResult:
+    """Rebuild the solution function from its source and test it"""
+    from .testsuite import run_pytest_for_function
+
+    os.chdir(request.cwd)
+
+    if on_deadline is not None:
+        # A `timeout` marker may give a test more time than the kernel expects
+        try:
+            on_deadline(
+                get_test_session(request.module_file).worker_deadline(
+                    request.function_name, request.options.limits
+                )
+            )
+        except Exception:
+            # A test module that cannot be collected is reported by the run
+            pass
+
+    namespace: dict = {"__name__": "__main__"}
+    for alias, module_name in request.kernel_globals.modules.items():
+        try:
+            namespace[alias] = importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+    try:
+        # Rebuild what the cell uses from the other cells, then the cell itself
+        for definition in request.kernel_globals.definitions:
+            exec(compile(definition, "<ipytest-cell>", "exec"), namespace)
+        for name, value in request.kernel_globals.values.items():
+            namespace[name] = _NamespaceUnpickler(io.BytesIO(value), namespace).load()
+        exec(compile(request.source_code, "<ipytest-cell>", "exec"), namespace)
+        implementation = namespace[f"solution_{request.function_name}"]
+    except Exception as err:
+        return IPytestResult(status=IPytestOutcome.COMPILE_ERROR, exceptions=[err])
+
+    with address_space_limit(request.options.limits.memory_mb):
+        return run_pytest_for_function(
+            request.module_file,
+            AFunction(
+                name=request.function_name,
+                implementation=implementation,
+                source_code=request.source_code,
+            ),
+            on_result,
+            request.options,
+        )
+
+
+def _worker_main(conn: Connection, preload: tuple[str, ...]) -> None:
+    """Entry point of a worker process: serve requests until the pipe is closed"""
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+    while True:
+        try:
+            request: WorkerRequest = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        # Without streaming, a bare tick still tells the kernel the worker is alive
+        def send_progress(test: TestCaseResult, stream: bool = request.stream) -> None:
+            conn.send(("progress", _picklable_test(test) if stream else None))
+
+        try:
+            result = _execute_request(
+                request,
+                send_progress,
+                lambda deadline: conn.send(("deadline", deadline)),
+            )
+        except Exception as err:
+            result = IPytestResult(
+                status=IPytestOutcome.UNKNOWN_ERROR, exceptions=[err]
+            )
+
+        conn.send(("result", make_picklable(result)))
+
+
+class Worker:
+    """A worker process and the pipe to talk to it"""
+
+    def __init__(
+        self, context: multiprocessing.context.BaseContext, preload: tuple[str, ...]
+    ) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(  # type: ignore[attr-defined]
+            target=_worker_main, args=(child_conn, preload), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """A pool of warm worker processes to run the tests outside of the kernel"""
+
+    def __init__(
+        self, size: int = DEFAULT_WORKERS, preload: tuple[str, ...] = PRELOAD_MODULES
+    ) -> None:
+        self._context = process_context(preload)
+
+        # The workers inherit the directory where too large outputs are saved
+        output_directory()
+
+        self.size = size
+        self.preload = preload
+        self._idle: Queue[Worker] = Queue()
+        self._closed = False
+
+        for _ in range(size):
+            self._idle.put(Worker(self._context, preload))
+
+    def _acquire(self) -> Worker:
+        worker = self._idle.get()
+        if not worker.is_alive():
+            worker.kill()
+            worker = Worker(self._context, self.preload)
+        return worker
+
+    def _release(self, worker: Worker) -> None:
+        if self._closed:
+            worker.kill()
+        else:
+            self._idle.put(worker)
+
+    def run(
+        self,
+        module_file: pathlib.Path,
+        function: AFunction,
+        cell_content: str | None = None,
+        kernel_globals: KernelGlobals | None = None,
+        on_result: Callable[[TestCaseResult], None] | None = None,
+        options: RunOptions | None = None,
+    ) -> IPytestResult:
+        """
+        Test a solution function in one of the workers.
+        If given, `on_result` is called in the kernel with each test result as it arrives.
+        A worker that stays silent for longer than the time limits allow is killed.
+        """
+        source_code = cell_content or function.source_code or ""
+        request = WorkerRequest(
+            module_file=module_file,
+            function_name=function.name,
+            source_code=source_code,
+            kernel_globals=kernel_globals or KernelGlobals(),
+            cwd=os.getcwd(),
+            stream=on_result is not None,
+            options=options or RunOptions(),
+        )
+        deadline = request.options.limits.worker_deadline
+
+        worker = self._acquire()
+        try:
+            worker.conn.send(request)
+            while True:
+                if deadline is not None and not worker.conn.poll(deadline):
+                    # Stuck where a signal cannot interrupt it, e.g., in C code
+                    worker.kill()
+                    worker = Worker(self._context, self.preload)
+                    return IPytestResult(
+                        function=function,
+                        status=IPytestOutcome.TIMEOUT,
+                        exceptions=[TestTimeoutError(deadline)],
+                    )
+                kind, payload = worker.conn.recv()
+                if kind == "deadline":
+                    deadline = payload
+                    continue
+                if kind == "result":
+                    result: IPytestResult = payload
+                    break
+                if on_result is not None and payload is not None:
+                    on_result(payload)
+        except (EOFError, OSError):
+            # The worker died while running the tests, e.g., it ran out of memory
+            worker.kill()
+            worker = Worker(self._context, self.preload)
+            return IPytestResult(
+                function=function,
+                status=IPytestOutcome.PYTEST_ERROR,
+                exceptions=[WorkerCrashedError()],
+            )
+        finally:
+            self._release(worker)
+
+        return dataclasses.replace(result, function=function)
+
+    def close(self) -> None:
+        """Stop all the workers"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except Empty:
+                break
+
+
+_pool: WorkerPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> WorkerPool:
+    """Return the per-kernel worker pool, starting it on first use"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            size = int(os.getenv("IPYTEST_WORKERS", DEFAULT_WORKERS))
+            _pool = WorkerPool(size=max(1, size))
+
+    return _pool
+
+
+def imported_modules(namespace: dict) -> dict[str, str]:
+    """Map the names bound to modules in a namespace to the modules' names"""
+    return {
+        alias: value.__name__
+        for alias, value in namespace.items()
+        if isinstance(value, ModuleType) and not alias.startswith("_")
+    }